@@ -10,7 +10,8 @@ class TopLevelListPageView(PageView):
 
         # We convert the queryset to a list so that we can manipulate
         # the model instances in the get() and post() methods
-        c['children'] = list(c['page'].get_children().filter(state=5))
+        c['children'] = list(
+            c['page'].get_children().filter(state=5).prefetch_content())
 
         return c
 
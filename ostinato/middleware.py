@@ -2,28 +2,67 @@
 # Original author: udfalkso
 # Modified by: Shwagroo Team and Gun.io
 
-import sys
-import os
+import cProfile
+import marshal
+import pstats
+import random
 import re
-import hotshot, hotshot.stats
-import tempfile
-import StringIO
+import time
 
 from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.utils import six
 
+from ostinato.profiling import sampler, PROFILE_SETTINGS
 
-# Now for some debugging tools
-words_re = re.compile( r'\s+' )
 
+# Now for some debugging tools
 group_prefix_re = [
     re.compile( "^.*/django/[^/]+" ),
     re.compile( "^(.*)/[^/]+$" ), # extract module path
     re.compile( ".*" ),           # catch strange entries
 ]
 
+
+def get_callgrind(stats):
+    """
+    Converts the stats dictionary from ``pstats.Stats`` to the callgrind
+    format, which can be opened with kcachegrind or qcachegrind. Times are
+    in microseconds.
+    """
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, []).append((func, caller_stats))
+
+    lines = ['events: Microseconds', '']
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        filename, lineno, name = func
+        lines += [
+            'fl=%s' % filename,
+            'fn=%s' % name,
+            '%s %d' % (lineno, tt * 1000000),
+        ]
+
+        for callee, callee_stats in callees.get(func, []):
+            # cProfile records (cc, nc, tt, ct) for every caller
+            callee_nc, callee_ct = callee_stats[1], callee_stats[3]
+            lines += [
+                'cfl=%s' % callee[0],
+                'cfn=%s' % callee[2],
+                'calls=%d %s' % (callee_nc, callee[1]),
+                '%s %d' % (lineno, callee_ct * 1000000),
+            ]
+
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
 class ProfileMiddleware(object):
     """
-    Displays hotshot profiling for any view.
+    Displays cProfile profiling for any view.
     http://yoursite.com/yourview/?prof
 
     Add the "prof" key to query string by appending ?prof (or &prof=)
@@ -31,16 +70,31 @@ class ProfileMiddleware(object):
     It's set up to only be available in django's debug mode, is available for superuser otherwise,
     but you really shouldn't add this middleware to any production configuration.
 
-    WARNING: It uses hotshot profiler which is not thread safe.
+    Use ``?prof=callgrind`` or ``?prof=pstats`` to download the profile
+    instead. The pstats file can be loaded with ``pstats.Stats(filename)``.
+
+    The profiler is kept on the request, so this is safe to use with
+    threaded servers.
     """
+    def is_enabled(self, request):
+        return 'prof' in request.GET and (
+            settings.DEBUG or request.user.is_superuser)
+
     def process_request(self, request):
-        if (settings.DEBUG or request.user.is_superuser) and 'prof' in request.GET: 
-            self.tmpfile = tempfile.mktemp()
-            self.prof = hotshot.Profile(self.tmpfile)
+        if self.is_enabled(request):
+            request._profiler = cProfile.Profile()
 
     def process_view(self, request, callback, callback_args, callback_kwargs):
-        if (settings.DEBUG or request.user.is_superuser) and 'prof' in request.GET:
-            return self.prof.runcall(callback, request, *callback_args, **callback_kwargs)
+        profiler = getattr(request, '_profiler', None)
+        if profiler:
+            response = profiler.runcall(
+                callback, request, *callback_args, **callback_kwargs)
+
+            # Include the template rendering in the profile
+            if hasattr(response, 'render') and callable(response.render):
+                profiler.runcall(response.render)
+
+            return response
 
     def get_group(self, file):
         for g in group_prefix_re:
@@ -59,29 +113,24 @@ class ProfileMiddleware(object):
 
         return res
 
-    def summary_for_files(self, stats_str):
-        stats_str = stats_str.split("\n")[5:]
-
+    def summary_for_files(self, stats):
         mystats = {}
         mygroups = {}
 
         sum = 0
 
-        for s in stats_str:
-            fields = words_re.split(s);
-            if len(fields) == 7:
-                time = float(fields[2])
-                sum += time
-                file = fields[6].split(":")[0]
+        for (file, lineno, name), func_stats in stats.items():
+            tottime = func_stats[2]
+            sum += tottime
 
-                if not file in mystats:
-                    mystats[file] = 0
-                mystats[file] += time
+            if not file in mystats:
+                mystats[file] = 0
+            mystats[file] += tottime
 
-                group = self.get_group(file)
-                if not group in mygroups:
-                    mygroups[ group ] = 0
-                mygroups[ group ] += time
+            group = self.get_group(file)
+            if not group in mygroups:
+                mygroups[ group ] = 0
+            mygroups[ group ] += tottime
 
         return "<pre>" + \
                " ---- By file ----\n\n" + self.get_summary(mystats,sum) + "\n" + \
@@ -89,28 +138,105 @@ class ProfileMiddleware(object):
                "</pre>"
 
     def process_response(self, request, response):
-        if (settings.DEBUG or request.user.is_superuser) and 'prof' in request.GET:
-            self.prof.close()
+        profiler = getattr(request, '_profiler', None)
+        if not profiler:
+            return response
+
+        out = six.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        output = request.GET.get('prof')
+
+        if output == 'callgrind':
+            response = HttpResponse(
+                get_callgrind(stats.stats),
+                content_type='application/octet-stream')
+            response['Content-Disposition'] = \
+                'attachment; filename="profile.callgrind"'
+
+        elif output == 'pstats':
+            response = HttpResponse(
+                marshal.dumps(stats.stats),
+                content_type='application/octet-stream')
+            response['Content-Disposition'] = \
+                'attachment; filename="profile.pstats"'
+
+        else:
+            stats.sort_stats('time', 'calls')
+            stats.print_stats(40)
 
-            out = StringIO.StringIO()
-            old_stdout = sys.stdout
-            sys.stdout = out
+            response = HttpResponse(
+                "<pre>" + out.getvalue() + "</pre>" +
+                self.summary_for_files(stats.stats))
 
-            stats = hotshot.stats.load(self.tmpfile)
-            stats.sort_stats('time', 'calls')
-            stats.print_stats()
+        return response
 
-            sys.stdout = old_stdout
-            stats_str = out.getvalue()
 
-            if response and response.content and stats_str:
-                response.content = "<pre>" + stats_str + "</pre>"
+class SamplingProfileMiddleware(object):
+    """
+    Profiles a sample of the requests, with very little overhead, so that
+    it can be used on production traffic. The results are aggregated for
+    every view, and page views are split up by the page content type, eg.
+    ``page_dispatch:website.contactpage``.
+
+    Configure it with ``OSTINATO_PROFILE_SETTINGS``:
 
-            response.content = "\n".join(response.content.split("\n")[:40])
+    ``SAMPLE_RATE`` profile 1 in every N requests.
+    ``SLOW_THRESHOLD`` also profile requests that takes longer than this
+    many seconds.
+    ``OUTPUT_FILE`` append the stacks for recorded requests to this file.
 
-            response.content += self.summary_for_files(stats_str)
+    The results can also be viewed by staff with
+    ``ostinato.views.ProfileSamplesView``, see ``ostinato.urls``.
+    """
+    def __init__(self):
+        self.sample_rate = PROFILE_SETTINGS['SAMPLE_RATE']
+        self.threshold = PROFILE_SETTINGS['SLOW_THRESHOLD']
 
-            os.unlink(self.tmpfile)
+        if not self.sample_rate and self.threshold is None:
+            raise MiddlewareNotUsed
 
-        return response
+    def process_request(self, request):
+        request._profile_sampled = bool(self.sample_rate) and \
+            random.randint(1, self.sample_rate) == 1
+
+        # We can only tell if a request is slow once it's done, so all the
+        # requests needs to be sampled when there is a threshold.
+        if request._profile_sampled or self.threshold is not None:
+            request._profile_samples = sampler.start()
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if getattr(request, '_profile_samples', None):
+            request._profile_view = (callback, callback_kwargs)
 
+    def get_label(self, request, callback, callback_kwargs):
+        label = '%s.%s' % (callback.__module__, callback.__name__)
+
+        from ostinato.pages.views import page_dispatch, resolve_page_entry
+        if callback is page_dispatch:
+            # ``page_dispatch`` keeps the entry on the request, unless the
+            # response came from the response cache.
+            if hasattr(request, '_page_entry'):
+                entry = request._page_entry
+            else:
+                entry = resolve_page_entry(callback_kwargs)
+
+            label = 'page_dispatch:%s' % (
+                entry.template if entry else 'not_found')
+
+        return label
+
+    def process_response(self, request, response):
+        samples = getattr(request, '_profile_samples', None)
+        if samples:
+            sampler.stop(samples)
+
+            duration = time.time() - samples.start
+            slow = self.threshold is not None and duration >= self.threshold
+            if request._profile_sampled or slow:
+                # Only label the requests that are recorded
+                view = getattr(request, '_profile_view', None)
+                if view:
+                    samples.label = self.get_label(request, *view)
+                sampler.record(samples)
+
+        return response
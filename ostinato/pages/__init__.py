@@ -6,6 +6,11 @@ OSTINATO_PAGES_SETTINGS = getattr(settings, 'OSTINATO_PAGES_SETTINGS', {})
 PAGES_SETTINGS = {
     'CACHE_NAME': 'default',
     'DEFAULT_STATE': 'public',
+    'CACHE_RESPONSES': False,
+    'RESPONSE_CACHE_TIMEOUT': 60 * 5,
+    'CONDITIONAL_RESPONSES': False,
+    'SERVER_TIMING': False,
+    'LAZY_ADMIN_TREE': False,
 }
 PAGES_SETTINGS.update(OSTINATO_PAGES_SETTINGS)
 
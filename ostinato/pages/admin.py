@@ -1,6 +1,14 @@
+from django.conf.urls import url
 from django.contrib import admin
+from django.contrib.admin.templatetags.admin_list import items_for_result
 from django.contrib.admin.utils import unquote
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.sites.models import Site
+from django.core.exceptions import PermissionDenied
+from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
 from django.template.loader import render_to_string
 from django import forms
@@ -11,30 +19,74 @@ from ostinato.statemachine.forms import sm_form_factory
 from ostinato.pages.models import Page
 from ostinato.pages.workflow import get_workflow
 from ostinato.pages.registry import page_content
+from ostinato.pages.widgets import PageParentWidget
+from ostinato.pages import PAGES_SETTINGS
 
 
 def content_inline_factory(page):
-    content_model = page.get_content_model()
+    """ Returns the admin inline for the content of ``page`` """
+    return page_content.get_inlines(page.get_content_model())[0]
+
+
+class PageChangeList(ChangeList):
+    """
+    Works out the site names, state names and template names for the pages
+    in the changelist once, so that the columns for every row can be looked
+    up in these, instead of querying or building them for each row.
+
+    When the admin has ``lazy_tree`` enabled, only the root pages are listed
+    (unless the list is searched or filtered), and the children for a page
+    are loaded when it's expanded. Pass ``parent`` to list all the children
+    for that page instead.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.parent = kwargs.pop('parent', None)
+        super(PageChangeList, self).__init__(request, *args, **kwargs)
+
+    def get_queryset(self, request):
+        qs = super(PageChangeList, self).get_queryset(request)
+
+        self.lazy = (self.model_admin.lazy_tree and not self.query and
+                     not self.get_filters_params())
+
+        if self.parent:
+            return qs.filter(
+                tree_id=self.parent.tree_id,
+                lft__gt=self.parent.lft,
+                rght__lt=self.parent.rght,
+                level=self.parent.level + 1)
+        elif self.lazy:
+            return qs.filter(level=0)
+        return qs
+
+    def get_results(self, request):
+        if self.parent:
+            # The children are never paginated
+            self.result_list = list(self.queryset)
+            self.result_count = self.full_result_count = len(self.result_list)
+            self.show_full_result_count = False
+            self.show_admin_actions = True
+            self.can_show_all = True
+            self.multi_page = False
+            self.paginator = None
+        else:
+            super(PageChangeList, self).get_results(request)
 
-    class PageContentInline(admin.StackedInline):
-        model = content_model
-        extra = 1
-        max_num = 1
-        can_delete = False
-        fk_name = 'page'
-        classes = ('grp-collapse grp-open',)
-        inline_classes = ('grp-collapse grp-open',)
+        self.sites = {}
+        if getattr(settings, 'OSTINATO_PAGES_SITE_TREEID', None):
+            self.sites = Site.objects.in_bulk(
+                [p.tree_id for p in self.result_list if p.level == 0])
 
-        # Check for a custom form and try to load it
-        content_form = getattr(content_model.ContentOptions, 'form', None)
-        if content_form:
-            module_path, form_class = content_form.rsplit('.', 1)
+        workflow = get_workflow()
+        self.state_names = dict(
+            (k, v.verbose_name) for k, v in workflow.state_map.items())
+        self.initial_state = workflow.initial_state
 
-            form = __import__(
-                module_path, locals(), globals(), [form_class], -1
-            ).__dict__[form_class]
+        self.template_names = dict(page_content.get_template_choices())
 
-    return PageContentInline
+        for page in self.result_list:
+            page._changelist = self
 
 
 # Admin Models
@@ -47,15 +99,24 @@ class PageAdminForm(sm_form_factory(sm_class=get_workflow())):  # <3 python
         self.fields['template'].choices = page_content.get_template_choices()
         self.fields['parent'].widget.can_add_related = False
         self.fields['parent'].widget.can_change_related = False
-        if self.instance:
-            self.fields['parent'].queryset = Page.objects.exclude(
-                    id=self.instance.id)
+        if self.instance.pk:
+            # A page can't be moved to one of it's own descendants
+            self.fields['parent'].queryset = Page.objects.exclude_subtree(
+                self.instance)
+
+            # The admin wraps the widget to add the related links
+            widget = self.fields['parent'].widget
+            widget = getattr(widget, 'widget', widget)
+            widget.attrs['data-exclude'] = self.instance.pk
 
     class Meta:
         model = Page
         fields = ('title', 'short_title', 'slug', 'template', 'redirect',
                   'parent', 'show_in_nav', 'show_in_sitemap', 'state',
                   'publish_date')
+        widgets = {
+            'parent': PageParentWidget,
+        }
 
 
 class PageAdmin(MPTTModelAdmin):
@@ -88,11 +149,109 @@ class PageAdmin(MPTTModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
     change_list_template = 'admin/pages_change_list.html'
 
+    # Only list the root pages, and load the children when a page is expanded
+    lazy_tree = PAGES_SETTINGS['LAZY_ADMIN_TREE']
+
     class Media:
         js = (
             'pages/js/page_admin.js',
         )
 
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            url(r'^parent_search/$',
+                self.admin_site.admin_view(self.parent_search_view),
+                name='%s_%s_parent_search' % info),
+            url(r'^(.+)/children/$',
+                self.admin_site.admin_view(self.children_view),
+                name='%s_%s_children' % info),
+        ] + super(PageAdmin, self).get_urls()
+
+    def get_changelist(self, request, **kwargs):
+        return PageChangeList
+
+    def get_changelist_instance(self, request, **kwargs):
+        """
+        Returns a changelist, set up the same way that ``changelist_view()``
+        sets it up. ``kwargs`` are passed on to the changelist.
+        """
+        list_display = self.get_list_display(request)
+        if self.get_actions(request):
+            list_display = ['action_checkbox'] + list(list_display)
+
+        ChangeList = self.get_changelist(request)
+        cl = ChangeList(
+            request, self.model, list_display,
+            self.get_list_display_links(request, list_display),
+            self.get_list_filter(request), self.date_hierarchy,
+            self.get_search_fields(request),
+            self.get_list_select_related(request), self.list_per_page,
+            self.list_max_show_all, self.list_editable, self, **kwargs)
+        cl.formset = None
+        return cl
+
+    def children_view(self, request, object_id):
+        """
+        Returns the children for a page as json, including the rendered
+        changelist rows for them.
+        """
+        if not self.has_change_permission(request, None):
+            raise PermissionDenied
+
+        parent = self.get_object(request, unquote(object_id))
+        if parent is None:
+            raise Http404
+
+        cl = self.get_changelist_instance(request, parent=parent)
+        children = []
+        for page in cl.result_list:
+            children.append({
+                'id': page.id,
+                'tree_id': page.tree_id,
+                'level': page.level,
+                'lft': page.lft,
+                'rght': page.rght,
+                'descendant_count': page.get_descendant_count(),
+                'html': '<tr>%s</tr>' % ''.join(
+                    items_for_result(cl, page, None)),
+            })
+
+        return JsonResponse({'parent': parent.id, 'children': children})
+
+    def parent_search_view(self, request):
+        """
+        Returns the pages as json, where the slug or path starts with the
+        ``q`` parameter, for the ``PageParentWidget``. Both these fields are
+        indexed. The page with the id in ``exclude``, and it's descendants,
+        are left out.
+        """
+        if not (self.has_add_permission(request) or
+                self.has_change_permission(request, None)):
+            raise PermissionDenied
+
+        pages = Page.objects.all()
+
+        exclude = request.GET.get('exclude')
+        if exclude:
+            page = self.get_object(request, unquote(exclude))
+            if page is not None:
+                pages = pages.exclude_subtree(page)
+
+        query = request.GET.get('q', '').strip().strip('/')
+        if query:
+            pages = pages.filter(
+                Q(slug__startswith=slugify(query)) |
+                Q(path__startswith=query.lower()))
+
+        results = []
+        for id, title, path, level in pages.order_by(
+                'tree_id', 'lft').values_list('id', 'title', 'path', 'level')[:20]:
+            results.append(
+                {'id': id, 'title': title, 'path': path, 'level': level})
+
+        return JsonResponse({'results': results})
+
     def get_node_tag(self, obj):
         """
         A custom title for the list display that will be indented based on
@@ -104,6 +263,11 @@ class PageAdmin(MPTTModelAdmin):
         """
         if obj.get_descendant_count() > 0:
             descendents = 'descendents="true"'
+
+            cl = getattr(obj, '_changelist', None)
+            if cl and (cl.lazy or cl.parent):
+                descendents += ' children-url="%s"' % reverse(
+                    'admin:ostinato_pages_page_children', args=(obj.id,))
         else:
             descendents = ''
         tag = '<ost-page-node tree-id="%s" level="%s" lft="%s" rght="%s" %s>' % (
@@ -122,9 +286,13 @@ class PageAdmin(MPTTModelAdmin):
 
         if PAGES_SITE_TREEID:
             if obj.level == 0:
-                try:
-                    tree_site = Site.objects.get(id=obj.tree_id)
-                except:
+                cl = getattr(obj, '_changelist', None)
+                if cl:
+                    tree_site = cl.sites.get(obj.tree_id)
+                else:
+                    tree_site = Site.objects.filter(id=obj.tree_id).first()
+
+                if not tree_site:
                     return '%s %s (No Site)' % (node_tag, title)
                 return '%s %s (%s)' % (node_tag, title, tree_site.name)
 
@@ -139,65 +307,62 @@ class PageAdmin(MPTTModelAdmin):
     page_actions.allow_tags = True
 
     def page_state(self, obj):
+        cl = getattr(obj, '_changelist', None)
+        if cl:
+            return cl.state_names.get(
+                obj.state, cl.state_names[cl.initial_state])
+
         sm = get_workflow()(instance=obj)
         return sm.state
     page_state.short_description = _("State")
 
     def template_name(self, obj):
+        cl = getattr(obj, '_changelist', None)
+        if cl:
+            return cl.template_names.get(obj.template, obj.template)
         return page_content.get_template_name(obj.template)
     template_name.short_description = _("Template")
 
-    def add_view(self, request, form_url='', extra_context=None):
-        # We need to clear the inlines. Django keeps it cached somewhere
-        self.inlines = ()
-        return super(PageAdmin, self).add_view(request, form_url, extra_context)
-
-    def change_view(self, request, object_id, form_url='', extra_context=None):
+    def get_inlines(self, request, obj=None):
+        """
+        Returns the inline classes for ``obj``, which includes the inlines
+        for the content model of an existing page.
+        """
+        inlines = list(self.inlines)
+        if obj is not None and obj.pk:
+            # When the page is saved, ``obj`` already has the template from
+            # the form. The posted inlines are still the ones for the template
+            # in the database, so that is what the inlines are based on.
+            if not hasattr(obj, '_saved_template'):
+                obj._saved_template = Page.objects.filter(
+                    pk=obj.pk).values_list('template', flat=True).first()
+
+            content_model = page_content.get_content_model(
+                obj._saved_template)
+            if content_model:
+                inlines += page_content.get_inlines(content_model)
+        return inlines
+
+    def get_inline_instances(self, request, obj=None):
         """
-        We need to dynamically create the inline models since it
-        changes based on the template.
+        The same as ``ModelAdmin.get_inline_instances()``, but for the
+        inlines from ``get_inlines()``, since the inlines depend on the
+        template for the page. ``self.inlines`` is shared between requests,
+        so it's never changed.
         """
-        self.inlines = ()
-
-        if object_id:
-            page = self.get_object(request, unquote(object_id))
-
-            if page.template:
-                self.inlines = (content_inline_factory(page),)
-
-            content_model = page.get_content_model()
-            if hasattr(content_model.ContentOptions, 'admin_inlines'):
-                for inline_def in content_model.ContentOptions.admin_inlines:
-                    through = None
-
-                    if isinstance(inline_def, (str, unicode)):
-                        inline_str = inline_def
-                    else:
-                        inline_str, through = inline_def
-
-                    try:
-                        module_path, inline_class = inline_str.rsplit('.', 1)
-                        inline = __import__(
-                            module_path, locals(), globals(),
-                            [inline_class], -1
-                        ).__dict__[inline_class]
-
-                    except KeyError:
-                        raise Exception(
-                            '"%s" could not be imported from, '
-                            '"%s". Please check the import path for the page '
-                            'inlines' % (inline_class, module_path))
-
-                    except AttributeError:
-                        raise Exception(
-                            'Incorrect import path for page '
-                            'content inlines. Expected a string containing the '
-                            'full import path.')
-
-                    self.inlines += (inline,)
-
-        return super(PageAdmin, self).change_view(
-            request, object_id, form_url, extra_context)
+        inline_instances = []
+        for inline_class in self.get_inlines(request, obj):
+            inline = inline_class(self.model, self.admin_site)
+            if request:
+                if not (inline.has_add_permission(request) or
+                        inline.has_change_permission(request, obj) or
+                        inline.has_delete_permission(request, obj)):
+                    continue
+                if not inline.has_add_permission(request):
+                    inline.max_num = 0
+            inline_instances.append(inline)
+
+        return inline_instances
 
 
 admin.site.register(Page, PageAdmin)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
 
 
 class OstinatoPagesConfig(AppConfig):
@@ -6,3 +7,15 @@ class OstinatoPagesConfig(AppConfig):
     label = 'ostinato_pages'
     verbose_name = 'Ostinato Pages'
 
+    def ready(self):
+        from ostinato.pages.registry import page_content
+        from ostinato.pages.models import clear_response_cache
+
+        # All the content models have been registered by now
+        page_content.build_index()
+        page_content.build_views()
+        page_content.build_inlines()
+
+        for content_model in page_content.all():
+            post_save.connect(clear_response_cache, sender=content_model)
+            post_delete.connect(clear_response_cache, sender=content_model)
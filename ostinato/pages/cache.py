@@ -0,0 +1,116 @@
+"""
+Helpers for the pages cache.
+
+Every key in the pages cache contains a generation number. Clearing the
+whole pages cache is then just a matter of incrementing the generation,
+after which the old keys will never be read again and will be evicted by
+the cache backend.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import iri_to_uri
+from django.utils.translation import get_language
+
+from ostinato.pages import PAGES_SETTINGS, memo, instrumentation
+
+
+GENERATION_KEY = 'ostinato:pages:generation'
+
+# Rendered pages can include navbars, breadcrumbs and content for any of
+# the other pages, so cached responses have their own generation, which is
+# incremented whenever any page changes.
+RESPONSE_GENERATION_KEY = 'ostinato:pages:responses:generation'
+
+# Most of the pages cache is set to timeout after a month
+CACHE_TIMEOUT = 60 * 60 * 24 * 7 * 4
+
+
+def get_cache():
+    return instrumentation.wrap_cache(caches[PAGES_SETTINGS['CACHE_NAME']])
+
+
+def get_generation():
+    return get_generations(GENERATION_KEY)[0]
+
+
+def get_response_generation():
+    return get_generations(RESPONSE_GENERATION_KEY)[0]
+
+
+def get_generations(*keys):
+    """
+    Returns the generations for ``keys``. Generations that are not in the
+    request memo yet are read from the cache in one go.
+    """
+    values = dict((k, memo.get_value(k)) for k in keys)
+    missing = [k for k in keys if values[k] is None]
+
+    if missing:
+        cache = get_cache()
+        values.update(cache.get_many(missing))
+
+        for key in missing:
+            if values.get(key) is None:
+                # Seed the generation from the clock, so that clearing the
+                # cache will never take us back to a generation that was
+                # used before.
+                cache.add(key, int(time.time() * 1000), None)
+                values[key] = cache.get(key)
+
+            memo.set_value(key, values[key])
+
+    return [values[k] for k in keys]
+
+
+def _bump_generation(key):
+    memo.reset()
+    try:
+        get_cache().incr(key)
+    except ValueError:
+        # The key is missing, which means there is nothing to invalidate
+        get_generations(key)
+
+
+def bump_generation():
+    """ Invalidates every key in the pages cache """
+    _bump_generation(GENERATION_KEY)
+
+
+def bump_response_generation():
+    """ Invalidates all the cached responses """
+    _bump_generation(RESPONSE_GENERATION_KEY)
+
+
+def make_key(key, generation=None):
+    """
+    Returns the full cache key for ``key`` in the current generation.
+    eg. ``make_key('page:1:url')``
+    """
+    if generation is None:
+        generation = get_generation()
+    return 'ostinato:pages:%s:%s' % (generation, key)
+
+
+def make_keys(keys):
+    """ Same as ``make_key()``, but reads the generation only once """
+    generation = get_generation()
+    return [make_key(k, generation) for k in keys]
+
+
+def make_response_key(request):
+    """
+    Returns the key for the cached response for ``request``. This is
+    based on the path, the site tree and the active language. The query
+    string is left out, so don't cache responses for requests with one.
+    """
+    generation, response_generation = get_generations(
+        GENERATION_KEY, RESPONSE_GENERATION_KEY)
+
+    path = hashlib.md5(iri_to_uri(request.path)).hexdigest()
+    site = getattr(settings, 'OSTINATO_PAGES_SITE_TREEID', None) or ''
+
+    return make_key('response:%s:%s:%s:%s' % (
+        response_generation, site, get_language(), path), generation)
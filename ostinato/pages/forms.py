@@ -1,5 +1,7 @@
 from django import forms
 
+from mptt.forms import TreeNodePositionField
+
 from ostinato.pages.models import Page
 
 
@@ -7,26 +9,20 @@ class MovePageForm(forms.Form):
 
     node = forms.IntegerField()
     target = forms.IntegerField()
-    position = forms.CharField()
+    position = forms.ChoiceField(choices=TreeNodePositionField.DEFAULT_CHOICES)
 
     def clear_page_cache(self):
-        Page.objects.clear_url_cache()
-        Page.objects.clear_navbar_cache()
-        Page.objects.clear_breadcrumbs_cache()
-
-    def save(self, *args, **kwargs):
-        page_id = self.cleaned_data['node']
-        target_id = self.cleaned_data['target']
-        position = self.cleaned_data['position']
-
-        page = Page.objects.get(id=page_id)
-        target= Page.objects.get(id=target_id)
+        Page.objects.invalidate()
 
-        # IMPORTANT: Clear the url, navbar and breadcrumbs cache
-        self.clear_page_cache()
+    def get_move(self):
+        """ Returns the move for ``PageManager.move_pages()`` """
+        return (self.cleaned_data['node'], self.cleaned_data['target'],
+                self.cleaned_data['position'])
 
-        # Now move the page
-        page.move_to(target, position)
+    def save(self, *args, **kwargs):
+        # The url, navbar and breadcrumbs cache is cleared once the page
+        # has been moved.
+        Page.objects.move_pages([self.get_move()])
 
 
 class DuplicatePageForm(MovePageForm):
@@ -44,9 +40,6 @@ class DuplicatePageForm(MovePageForm):
 
         target = Page.objects.get(id=target_id)
 
-        # IMPORTANT: Clear the url, navbar and breadcrumbs cache
-        self.clear_page_cache()
-
         # Create and save the duplicate page
         page.pk = None
         page.slug += '-copy'
@@ -58,5 +51,9 @@ class DuplicatePageForm(MovePageForm):
             page_content.page = new_page
             page_content.save()
 
+        # IMPORTANT: Clear the url, navbar and breadcrumbs cache, now that
+        # the copy is in the tree.
+        self.clear_page_cache()
+
         return new_page
 
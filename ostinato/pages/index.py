@@ -0,0 +1,119 @@
+import threading
+import uuid
+from collections import namedtuple
+
+from ostinato.pages import memo
+from ostinato.pages.cache import get_cache, get_generation, GENERATION_KEY
+
+
+INDEX_VERSION_KEY = 'ostinato:pages:index:version'
+
+PageEntry = namedtuple('PageEntry', [
+    'id', 'path', 'template', 'state', 'redirect', 'tree_id', 'level'])
+
+
+class PageIndex(object):
+    """
+    An in-process index of the page tree, mapping the url path of every
+    page to a ``PageEntry``. This allows us to resolve a path to a page
+    without hitting the database.
+
+    The index is built once per process and rebuilt when the version stamp
+    in the pages cache changes. Call ``invalidate()`` whenever pages are
+    changed so that all processes will rebuild their index.
+
+    The index also keeps the field values for every page, so that the page
+    for a request can be created without a query, see ``get_page()``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._paths = {}
+        self._roots = {}
+        self._rows = {}
+        self._fields = ()
+
+    def get_version(self):
+        """
+        Returns the version stamp for the index. This includes the pages
+        cache generation, so clearing the whole pages cache will also
+        rebuild the index. The stamp is only read from the cache once for
+        every request, see ``ostinato.pages.memo``.
+        """
+        return memo.memoize(('index', 'version'), self._get_version)
+
+    def _get_version(self):
+        cache = get_cache()
+        keys = [GENERATION_KEY, INDEX_VERSION_KEY]
+        values = cache.get_many(keys)
+
+        if len(values) < len(keys):
+            # The cache was cleared or never set. Make sure we have a stamp
+            # that no process could have built an index against.
+            get_generation()
+            cache.add(INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+            values = cache.get_many(keys)
+
+        return tuple(values.get(k) for k in keys)
+
+    def invalidate(self):
+        get_cache().set(INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+        memo.reset()
+
+    def build(self):
+        """
+        Reads all the fields for the whole tree in a single query, and maps
+        the paths and page ids.
+        """
+        from ostinato.pages.models import Page
+
+        fields = tuple(f.attname for f in Page._meta.concrete_fields)
+        positions = [fields.index(f) for f in PageEntry._fields]
+
+        paths, roots, rows = {}, {}, {}
+        for row in Page.objects.values_list(*fields):
+            entry = PageEntry(*[row[i] for i in positions])
+            paths[entry.path] = entry
+            rows[entry.id] = row
+            if entry.level == 0:
+                roots[entry.tree_id] = entry
+
+        return paths, roots, rows, fields
+
+    def refresh(self):
+        """ Rebuild the index if the version stamp has changed """
+        version = self.get_version()
+
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._paths, self._roots, self._rows, self._fields = \
+                        self.build()
+                    self._version = version
+
+    def get(self, path):
+        """ Returns the ``PageEntry`` for ``path``, or None """
+        self.refresh()
+        return self._paths.get(path.strip('/'))
+
+    def get_root(self, tree_id):
+        """ Returns the ``PageEntry`` for the root page in ``tree_id`` """
+        self.refresh()
+        return self._roots.get(tree_id)
+
+    def get_page(self, page_id):
+        """
+        Returns a new ``Page`` instance for ``page_id``, created from the
+        field values in the index, or None if there is no such page.
+        """
+        from ostinato.pages.models import Page
+
+        self.refresh()
+        row = self._rows.get(page_id)
+        if row is None:
+            return None
+        return Page.from_db(Page.objects.db, self._fields, row)
+
+
+page_index = PageIndex()
@@ -0,0 +1,193 @@
+"""
+Per request instrumentation for pages.
+
+While ``ostinato.pages.middleware.PageInstrumentationMiddleware`` is active,
+the database queries and cache operations are counted and timed for each of
+the ostinato call sites, eg. ``get_navbar`` or ``get_content``. Anything
+that happens outside of these is counted as ``other``.
+
+When a call site is used inside another one (eg. ``get_content`` in a
+custom ``get_navbar``), the queries and cache operations are only counted
+for the innermost call site.
+"""
+import functools
+import threading
+import time
+from itertools import islice
+
+from django.db import connection
+from django.dispatch import Signal
+
+
+# Sent at the end of every instrumented request, with the ``stats`` dict
+page_request_instrumented = Signal(providing_args=['request', 'stats'])
+
+CACHE_OPERATIONS = {
+    'get': 'cache_gets',
+    'get_many': 'cache_gets',
+    'set': 'cache_sets',
+    'set_many': 'cache_sets',
+    'add': 'cache_sets',
+    'incr': 'cache_sets',
+    'delete': 'cache_deletes',
+    'delete_many': 'cache_deletes',
+}
+
+_local = threading.local()
+
+
+def is_active():
+    return getattr(_local, 'stats', None) is not None
+
+
+def start():
+    _local.stats = {}
+    _local.sites = []
+    _local.queries_start = len(connection.queries_log)
+    _local.force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+
+
+def stop():
+    """ Stops the instrumentation and returns the stats for the request """
+    _count_other_queries()
+    stats = _local.stats
+    _local.stats = None
+    connection.force_debug_cursor = _local.force_debug_cursor
+    return stats
+
+
+def get_site_stats(site):
+    stats = _local.stats.get(site)
+    if stats is None:
+        stats = _local.stats[site] = {
+            'calls': 0,
+            'queries': 0,
+            'query_time': 0.0,
+            'cache_gets': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'cache_sets': 0,
+            'cache_deletes': 0,
+            'cache_time': 0.0,
+        }
+    return stats
+
+
+def get_current_site():
+    return _local.sites[-1]['name'] if _local.sites else 'other'
+
+
+def instrumented(site):
+    """
+    Decorator for the call sites. Counts the queries made while the
+    function is running against ``site``.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_active():
+                return func(*args, **kwargs)
+
+            frame = {
+                'name': site,
+                'start': len(connection.queries_log),
+                'claimed': 0,
+                'claimed_time': 0.0,
+            }
+            _local.sites.append(frame)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _local.sites.pop()
+                _count_queries(frame)
+
+        return wrapper
+    return decorator
+
+
+def _get_queries(start):
+    """ Returns the amount and total time (in ms) of queries since start """
+    queries = list(islice(connection.queries_log, start, None))
+    return len(queries), sum(float(q['time']) for q in queries) * 1000
+
+
+def _count_queries(frame):
+    count, query_time = _get_queries(frame['start'])
+
+    stats = get_site_stats(frame['name'])
+    stats['calls'] += 1
+    stats['queries'] += count - frame['claimed']
+    stats['query_time'] += query_time - frame['claimed_time']
+
+    # Make sure the queries are not counted again for the outer call site
+    if _local.sites:
+        _local.sites[-1]['claimed'] += count
+        _local.sites[-1]['claimed_time'] += query_time
+
+
+def _count_other_queries():
+    """ Counts the queries that were not made by any call site """
+    count, query_time = _get_queries(_local.queries_start)
+    stats = _local.stats.values()
+
+    count -= sum(s['queries'] for s in stats)
+    query_time -= sum(s['query_time'] for s in stats)
+
+    if count:
+        other = get_site_stats('other')
+        other['queries'] += count
+        other['query_time'] += query_time
+
+
+class InstrumentedCache(object):
+    """ Counts and times the operations on ``cache`` """
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def __getattr__(self, name):
+        attr = getattr(self._cache, name)
+        if name not in CACHE_OPERATIONS:
+            return attr
+
+        def operation(*args, **kwargs):
+            start = time.time()
+            result = attr(*args, **kwargs)
+            duration = (time.time() - start) * 1000
+
+            if is_active():
+                stats = get_site_stats(get_current_site())
+                stats[CACHE_OPERATIONS[name]] += 1
+                stats['cache_time'] += duration
+
+                if name == 'get':
+                    hit = result is not None
+                elif name == 'get_many':
+                    hit = len(result) == len(args[0])
+                else:
+                    hit = None
+
+                if hit is not None:
+                    stats['cache_hits' if hit else 'cache_misses'] += 1
+
+            return result
+
+        return operation
+
+
+def wrap_cache(cache):
+    """ Returns an instrumented ``cache`` when the instrumentation is active """
+    if is_active():
+        return InstrumentedCache(cache)
+    return cache
+
+
+def get_server_timing(stats):
+    """ Returns the ``Server-Timing`` header value for the ``stats`` """
+    metrics = []
+    for site, s in sorted(stats.items()):
+        metrics.append('%s;dur=%.2f;desc="%s queries, %s/%s cache hits"' % (
+            site, s['query_time'] + s['cache_time'], s['queries'],
+            s['cache_hits'], s['cache_hits'] + s['cache_misses']))
+    return ', '.join(metrics)
@@ -1,17 +1,111 @@
-from django.core.cache import caches
+from django.core.urlresolvers import reverse
 from django.utils import timezone
 from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Concat, Substr
+from django.db.models.query import ModelIterable
 
 from mptt.managers import TreeManager
-from ostinato.pages import PAGES_SETTINGS
+from mptt.querysets import TreeQuerySet
+from ostinato.pages import memo
+from ostinato.pages.index import page_index
+from ostinato.pages.instrumentation import instrumented
+from ostinato.pages.cache import (
+    get_cache, get_generation, make_key, make_keys, bump_generation,
+    bump_response_generation, CACHE_TIMEOUT)
 
 
-class PageManager(TreeManager):
+# Cached in place of a page id for paths that doesn't resolve to a page
+PAGE_NOT_FOUND = 0
+
+# The root page of this tree is the home page, and is served on the root url
+HOME_TREE_ID = 1
+
+# Changing a page with more descendants than this clears the cache for all
+# pages, which is a single cache operation, instead of deleting the keys for
+# every page in the subtree.
+SUBTREE_KEYS_LIMIT = 250
+
+
+def get_page_url(path, tree_id=None, level=None, home_url=None):
+    """
+    Returns the url for the page with ``path``. The root page of the home
+    tree is served on the home url, as is an empty ``path``. Pass in
+    ``home_url`` when building urls for many pages, so that it's only
+    reversed once.
+    """
+    if home_url is None:
+        home_url = reverse('ostinato_page_home')
+
+    if not path or (level == 0 and tree_id == HOME_TREE_ID):
+        return home_url
+    return '%s%s/' % (home_url, path)
+
+
+def prefetch_content(pages):
+    """
+    Loads the content for all of the ``pages`` with a single query for
+    every content model, instead of a query for every page.
+    """
+    by_model = {}
+    for page in pages:
+        if page._contents is None:
+            content_model = page.get_content_model()
+            if content_model:
+                by_model.setdefault(content_model, []).append(page)
+
+    for content_model, model_pages in by_model.items():
+        contents = content_model.objects.filter(page__in=model_pages)
+        contents = dict((c.page_id, c) for c in contents)
+
+        for page in model_pages:
+            page._contents = memo.set_value(
+                ('content', page.id), contents.get(page.id, 'empty'))
+
+
+class PageQuerySet(TreeQuerySet):
+
+    _prefetch_content = False
+
+    def prefetch_content(self):
+        """
+        Loads the content for all the pages when the queryset is evaluated,
+        using one query for every content model. eg.
+        ``page.get_children().prefetch_content()``
+        """
+        clone = self._clone()
+        clone._prefetch_content = True
+        return clone
+
+    def exclude_subtree(self, page):
+        """
+        Excludes ``page`` and all it's descendants, eg. the pages that
+        can't be a parent for ``page``.
+        """
+        return self.exclude(
+            tree_id=page.tree_id, lft__gte=page.lft, rght__lte=page.rght)
+
+    def _clone(self, **kwargs):
+        clone = super(PageQuerySet, self)._clone(**kwargs)
+        clone._prefetch_content = self._prefetch_content
+        return clone
+
+    def _fetch_all(self):
+        fetch = self._result_cache is None
+        super(PageQuerySet, self)._fetch_all()
+
+        if fetch and self._prefetch_content and \
+                self._iterable_class is ModelIterable:
+            prefetch_content(self._result_cache)
+
+
+class PageManager(TreeManager.from_queryset(PageQuerySet)):
 
     def published(self):
         return self.get_queryset().filter(
             publish_date__lte=timezone.now(), state='public')
 
+    @instrumented('get_navbar')
     def get_navbar(self, for_page=None, clear_cache=False):
         """
         Returns a dictionary of pages with their short titles and urls.
@@ -21,124 +115,325 @@ class PageManager(TreeManager):
         """
         PAGES_SITE_TREEID = getattr(settings, 'OSTINATO_PAGES_SITE_TREEID', None)
 
-        cache = caches[PAGES_SETTINGS['CACHE_NAME']]
+        cache = get_cache()
         if for_page:
-            cache_key = 'ostinato:pages:page:%s:navbar' % for_page.id
+            cache_key = make_key('page:%s:navbar' % for_page.id)
         else:
-            cache_key = 'ostinato:pages:page:root:navbar'
+            cache_key = make_key('page:root:navbar')
 
         if clear_cache:
             cache.delete(cache_key)
 
-        # Try to get the path from the cache
-        navbar = cache.get(cache_key)
+        # Try to get the navbar from the request memo, then the cache
+        navbar = memo.memoize(
+            cache_key, lambda: cache.get(cache_key), refresh=clear_cache)
 
         if not navbar:
             navbar = []
+            home_url = reverse('ostinato_page_home')
 
             if PAGES_SITE_TREEID:
                 nav_items = self.published().filter(
                     parent__level=0, parent__tree_id=PAGES_SITE_TREEID,
                     show_in_nav=True)
-
             else:
                 nav_items = self.published().filter(
                     parent=for_page, show_in_nav=True)
 
             for page in nav_items:
+                if page.redirect:
+                    url = page.redirect
+                else:
+                    url = get_page_url(
+                        page.path, page.tree_id, page.level, home_url)
+
                 navbar.append({
                     'slug': page.slug,
                     'title': page.get_short_title(),
-                    'url': page.get_absolute_url(),
+                    'url': url,
                     'tree_id': page.tree_id,
                     'level': page.level,
                 })
 
-            # Set the cache to timeout after a month
-            cache.set(cache_key, navbar, 60 * 60 * 24 * 7 * 4)
+            cache.set(cache_key, memo.set_value(cache_key, navbar),
+                      CACHE_TIMEOUT)
 
-        return navbar
+        # Return a copy, so that the memoized navbar can't be changed
+        return list(navbar)
 
+    @instrumented('get_breadcrumbs')
     def get_breadcrumbs(self, for_page, clear_cache=False):
         """
         Returns a list of all the parents, plus the current page. Each item
         in the list contains a short title and url.
         """
-        cache = caches[PAGES_SETTINGS['CACHE_NAME']]
-        cache_key = 'ostinato:pages:page:%s:crumbs' % for_page.id
+        cache = get_cache()
+        cache_key = make_key('page:%s:crumbs' % for_page.id)
 
         if clear_cache:
             cache.delete(cache_key)
 
-        crumbs = cache.get(cache_key)
+        crumbs = memo.memoize(
+            cache_key, lambda: cache.get(cache_key), refresh=clear_cache)
 
         if not crumbs:
-            parents = for_page.get_ancestors()
+            home_url = reverse('ostinato_page_home')
             crumbs = []
-            for page in parents:
+
+            for page in for_page.get_ancestors(include_self=True):
+                if page.redirect:
+                    url = page.redirect
+                else:
+                    url = get_page_url(
+                        page.path, page.tree_id, page.level, home_url)
+
                 crumbs.append({
                     'slug': page.slug,
                     'title': page.get_short_title(),
-                    'url': page.get_absolute_url(),
+                    'url': url,
                 })
-            crumbs.append({
-                'slug': for_page.slug,
-                'title': for_page.get_short_title(),
-                'url': for_page.get_absolute_url()
-            })
 
-            # Set the cache to timeout after a month
-            cache.set(cache_key, crumbs, 60 * 60 * 24 * 7 * 4)
+            cache.set(cache_key, memo.set_value(cache_key, crumbs),
+                      CACHE_TIMEOUT)
 
-        return crumbs
+        # Return a copy, since the breadcrumbs tag appends to the list
+        return list(crumbs)
 
+    @instrumented('get_from_path')
     def get_from_path(self, url_path, clear_cache=False):
-        """ Returns a page object, base on the url path. """
-        cache = caches[PAGES_SETTINGS['CACHE_NAME']]
-        cache_key = 'ostinato:pages:page_for_path:%s' % url_path
+        """
+        Returns a page object, based on the url path, or None if there is
+        no page on that path.
+
+        The full path is matched against the ``path`` field for the page,
+        so ``/page-2/page-3/`` will not resolve if ``page-3`` is not a child
+        of ``page-2``. Paths that doesn't resolve are cached as well.
+        """
+        cache = get_cache()
+
+        home_url = reverse('ostinato_page_home')
+        path = url_path
+        if path.startswith(home_url):
+            path = path[len(home_url):]
+        path = path.strip('/')
+
+        url = get_page_url(path, home_url=home_url)
+        cache_key = make_key('page_for_path:%s' % url)
 
         if clear_cache:
             cache.delete(cache_key)
 
-        page = cache.get(cache_key)
+        # The path lookup only caches the page id
+        page_id = memo.memoize(
+            cache_key, lambda: cache.get(cache_key), refresh=clear_cache)
+
+        if page_id is None:
+            if path:
+                page = self.get_queryset().filter(path=path).first()
+            else:
+                # The home page is the root page for the current site
+                PAGES_SITE_TREEID = getattr(
+                    settings, 'OSTINATO_PAGES_SITE_TREEID', None)
+                page = self.root_nodes().filter(
+                    tree_id=PAGES_SITE_TREEID or HOME_TREE_ID).first()
+
+            # Cache the failed lookup as well, so that unknown paths don't
+            # hit the database every time.
+            page_id = page.id if page else PAGE_NOT_FOUND
+            cache.set(cache_key, memo.set_value(cache_key, page_id),
+                      CACHE_TIMEOUT)
+            if page:
+                memo.set_value(('page', page.id), page)
+            return page
+
+        if page_id == PAGE_NOT_FOUND:
+            return None
+        return self.get_page(page_id)
 
-        if not page:
-            path = url_path.split('/')
-            path.reverse()
+    def get_page(self, page_id):
+        """
+        Returns the page with ``page_id`` or None if it doesn't exist. The
+        page is created from the page index, without a query, and the same
+        instance is returned for the rest of the request.
+        """
+        return memo.memoize(
+            ('page', page_id), lambda: page_index.get_page(page_id))
 
-            for node in path:
-                try:
-                    if node:
-                        page = self.get_queryset().get(slug=node)
-                        cache.set(cache_key, page, 60 * 60 * 24 * 7 * 4)
-                        break
-                except:
-                    pass
+    def update_descendant_paths(self, page, old_path):
+        """
+        Replaces ``old_path`` at the start of the ``path`` for all the
+        descendants of ``page``, with the current path for ``page``. This
+        is done in a single update, regardless of the size of the subtree.
+        """
+        if old_path == page.path:
+            return
 
-        return page
+        page.get_descendants().update(path=Concat(
+            models.Value(page.path), Substr('path', len(old_path) + 1),
+            output_field=models.CharField()))
+
+    def get_cache_keys(self, page, descendants=True, old_path=None):
+        """
+        Returns the cache keys (without the generation) for everything
+        that is cached for ``page`` and, if ``descendants`` is True, it's
+        descendants; their urls, navbars, breadcrumbs and path lookups.
+        This also includes the navbar that lists ``page``.
+
+        If the path for ``page`` changed from ``old_path``, the path lookups
+        for the old paths of the pages are included as well.
+
+        Returns None if ``page`` has more than ``SUBTREE_KEYS_LIMIT``
+        descendants, since it's cheaper to clear the cache for all pages.
+
+        This uses the tree fields on ``page``, so pass an instance that
+        reflects the tree as it is in the database.
+        """
+        if not descendants:
+            nodes = [(page.id, page.path)]
+        elif page.get_descendant_count() > SUBTREE_KEYS_LIMIT:
+            return None
+        else:
+            nodes = page.get_descendants(include_self=True).values_list(
+                'id', 'path')
+
+        home_url = reverse('ostinato_page_home')
+
+        keys = ['page:%s:navbar' % (page.parent_id or 'root')]
+
+        if page.level <= 1:
+            # The root navbar lists the first level pages for a site tree
+            keys.append('page:root:navbar')
+
+        if page.level == 0:
+            keys.append('page_for_path:%s' % home_url)
+
+        for id, path in nodes:
+            keys += [
+                'page:%s:url' % id,
+                'page:%s:navbar' % id,
+                'page:%s:crumbs' % id,
+                'page_for_path:%s' % get_page_url(path, home_url=home_url),
+            ]
+
+            if old_path is not None and old_path != page.path:
+                keys.append('page_for_path:%s' % get_page_url(
+                    old_path + path[len(page.path):], home_url=home_url))
+
+        return keys
+
+    def clear_cache_keys(self, keys):
+        """ Clears the keys returned by ``get_cache_keys()`` """
+        memo.reset()
+        get_cache().delete_many(make_keys(set(keys)))
+
+    def invalidate(self, keys=None):
+        """
+        Clears the cached urls, navbars and breadcrumbs for ``keys``, which is
+        a list of keys from ``get_cache_keys()``, along with the cached
+        responses and the page index. If no keys are specified, the cache
+        will be cleared for all pages.
+        """
+        if keys is None:
+            self.clear_cache()
+        else:
+            self.clear_cache_keys(keys)
+            bump_response_generation()
+        page_index.invalidate()
+
+    def move_pages(self, moves):
+        """
+        Moves pages in a single transaction. ``moves`` is a list of
+        ``(page, target, position)``, where ``page`` and ``target`` are
+        pages or page ids, and ``position`` is one of ``left``, ``right``,
+        ``first-child`` or ``last-child``. The moves are applied in order,
+        and if any of them fails, none of the pages are moved. A move
+        fails with ``InvalidMove`` if it makes the path for a page too long.
+
+        The cache is only cleared once the transaction is committed, so
+        that other requests can't cache the tree as it was before the
+        moves. Only the cache for the moved subtrees (and the navbars
+        listing them) is cleared, unless a page was moved to, or from the
+        root level, since that changes the tree ids.
+        """
+        keys = set()
+        clear_all = False
+
+        with transaction.atomic():
+            for page, target, position in moves:
+                # Earlier moves change the tree fields, so always get the
+                # pages as they are now.
+                page = self.get(id=getattr(page, 'id', page))
+                target = self.get(id=getattr(target, 'id', target))
+
+                page_keys = self.move_page(page, target, position)
+                if page_keys is None:
+                    clear_all = True
+                else:
+                    keys.update(page_keys)
+
+            transaction.on_commit(
+                lambda: self.invalidate(None if clear_all else list(keys)))
+
+    def move_page(self, page, target, position):
+        """
+        Moves ``page`` without clearing the cache, and returns the keys for
+        ``invalidate()`` to clear for the move. Use ``move_pages()`` or
+        ``Page.move_to()`` instead, which clear the cache as well.
+        """
+        clear_all = page.level == 0 or (
+            target.level == 0 and position in ('left', 'right'))
+
+        old_path = page.path
+        keys = self.get_cache_keys(page, descendants=False)
+        page._move_to(target, position)
+
+        if clear_all:
+            return None
+
+        # The subtree is only read once, after the move, which also gives
+        # the path lookups for the old paths.
+        new_keys = self.get_cache_keys(self.get(id=page.id), old_path=old_path)
+        if new_keys is None:
+            return None
+        return keys + new_keys
+
+    def clear_cache(self):
+        """
+        Clears the url, navbar and breadcrumbs cache for all pages. This is
+        done by moving the pages cache to a new generation, so it's a
+        single cache operation, regardless of the amount of pages.
+        """
+        bump_generation()
 
     def generate_url_cache(self):
-        for page in self.get_queryset().all():
-            page.get_absolute_url()
+        """
+        Caches the urls and path lookups for all pages. The urls are built
+        from a single query and written to the cache in one go.
+        """
+        home_url = reverse('ostinato_page_home')
+        generation = get_generation()
+        urls = {}
+
+        rows = self.get_queryset().values_list(
+            'id', 'path', 'redirect', 'tree_id', 'level')
+
+        for id, path, redirect, tree_id, level in rows:
+            url = get_page_url(path, tree_id, level, home_url)
+
+            # Redirects are never cached, see Page.get_absolute_url()
+            if not redirect:
+                urls[make_key('page:%s:url' % id, generation)] = url
+                urls[make_key('page_for_path:%s' % url, generation)] = id
+
+        get_cache().set_many(urls, CACHE_TIMEOUT)
 
+    # The url, navbar and breadcrumbs cache share a generation, so clearing
+    # any one of them will clear all of them.
     def clear_url_cache(self):
-        cache = caches[PAGES_SETTINGS['CACHE_NAME']]
-        pages = self.get_queryset()
-        page_ids = list(pages.values_list('id', flat=True))
-        # We must clear the page_for_path cache before the normal url cache
-        # since get_absolute_url() will create a cache if it doesn't exist
-        cache.delete_many(['ostinato:pages:page_for_path:%s' % p.get_absolute_url() for p in pages])
-        cache.delete_many(['ostinato:pages:page:%s:url' % i for i in page_ids])
+        self.clear_cache()
 
     def clear_navbar_cache(self):
-        cache = caches[PAGES_SETTINGS['CACHE_NAME']]
-        page_ids = list(self.get_queryset().values_list('id', flat=True))
-        cache.delete('ostinato:pages:page:root:navbar')
-        cache.delete_many(
-            ['ostinato:pages:page:%s:navbar' % i for i in page_ids])
+        self.clear_cache()
 
     def clear_breadcrumbs_cache(self):
-        cache = caches[PAGES_SETTINGS['CACHE_NAME']]
-        page_ids = list(self.get_queryset().values_list('id', flat=True))
-        cache.delete_many(
-            ['ostinato:pages:page:%s:crumbs' % i for i in page_ids])
+        self.clear_cache()
@@ -0,0 +1,62 @@
+"""
+A request scoped memo for pages.
+
+``ostinato.pages.middleware.PageMemoMiddleware`` starts a memo when a
+request comes in, and throws it away when the response goes out. While the
+memo is active, repeated lookups for the same pages, urls, navbars,
+breadcrumbs and content are served from memory, instead of going to the
+cache or the database every time.
+
+Outside of a request (or without the middleware) nothing is memoized.
+"""
+import threading
+
+
+_local = threading.local()
+
+
+def start():
+    _local.values = {}
+
+
+def stop():
+    _local.values = None
+
+
+def is_active():
+    return getattr(_local, 'values', None) is not None
+
+
+def reset():
+    """
+    Forgets all memoized values, but keeps the memo active. This is called
+    whenever the pages cache is cleared.
+    """
+    if is_active():
+        _local.values = {}
+
+
+def get_value(key, default=None):
+    if is_active():
+        return _local.values.get(key, default)
+    return default
+
+
+def set_value(key, value):
+    if is_active():
+        _local.values[key] = value
+    return value
+
+
+def memoize(key, func, refresh=False):
+    """
+    Returns the memoized value for ``key``. If there is no value yet, or
+    ``refresh`` is True, ``func`` is called to get the value.
+    """
+    if not is_active():
+        return func()
+
+    if refresh or key not in _local.values:
+        _local.values[key] = func()
+
+    return _local.values[key]
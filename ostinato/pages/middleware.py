@@ -0,0 +1,55 @@
+import logging
+
+from ostinato.pages import PAGES_SETTINGS, memo, instrumentation
+
+
+logger = logging.getLogger(__name__)
+
+
+class PageMemoMiddleware(object):
+    """
+    Memoizes page lookups, urls and content for the duration of a request.
+    Add this near the top of your ``MIDDLEWARE_CLASSES``, so that
+    everything after it can make use of the memo.
+    """
+
+    def process_request(self, request):
+        memo.start()
+
+    def process_response(self, request, response):
+        memo.stop()
+        return response
+
+
+class PageInstrumentationMiddleware(object):
+    """
+    Counts and times the database queries and cache operations for each
+    of the ostinato call sites, see ``ostinato.pages.instrumentation``.
+
+    The stats are logged at debug level, sent with the
+    ``page_request_instrumented`` signal and, if ``SERVER_TIMING`` is
+    enabled, added to the ``Server-Timing`` response header.
+    """
+
+    def process_request(self, request):
+        instrumentation.start()
+
+    def process_response(self, request, response):
+        if not instrumentation.is_active():
+            return response
+
+        stats = instrumentation.stop()
+
+        instrumentation.page_request_instrumented.send(
+            sender=self.__class__, request=request, stats=stats)
+
+        logger.debug('%s %s', request.path, ', '.join(
+            '%s: %s queries (%.2fms), %s/%s cache hits (%.2fms)' % (
+                site, s['queries'], s['query_time'], s['cache_hits'],
+                s['cache_hits'] + s['cache_misses'], s['cache_time'])
+            for site, s in sorted(stats.items())))
+
+        if PAGES_SETTINGS['SERVER_TIMING'] and stats:
+            response['Server-Timing'] = instrumentation.get_server_timing(stats)
+
+        return response
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    """
+    Builds the path for every page from the slugs of it's ancestors.
+    """
+    Page = apps.get_model('ostinato_pages', 'Page')
+    paths = {}
+
+    # Ordered by the tree, so the parent path is always known first
+    for page in Page.objects.order_by('tree_id', 'lft'):
+        if page.parent_id is None:
+            paths[page.id] = page.slug
+        else:
+            paths[page.id] = '%s/%s' % (paths[page.parent_id], page.slug)
+
+        Page.objects.filter(id=page.id).update(path=paths[page.id])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ostinato_pages', '0003_auto_20160420_2111'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Path'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
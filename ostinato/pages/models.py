@@ -1,18 +1,24 @@
 import re
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Max
+from django.db.models.functions import Length
 from django.contrib.auth.models import User
-from django.core.urlresolvers import reverse
-from django.core.cache import caches
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 
+from mptt.exceptions import InvalidMove
 from mptt.models import MPTTModel, TreeForeignKey
 
-from ostinato.pages.managers import PageManager
+from ostinato.pages.managers import PageManager, get_page_url
 from ostinato.pages.workflow import get_workflow
-from ostinato.pages import PAGES_SETTINGS
+from ostinato.pages.cache import (
+    get_cache, get_generation, make_key, bump_response_generation,
+    CACHE_TIMEOUT)
+from ostinato.pages import PAGES_SETTINGS, memo
+from ostinato.pages.instrumentation import instrumented
 
 
 class ContentError(Exception):
@@ -24,10 +30,25 @@ class ContentError(Exception):
         return self.value
 
 
-def _clear_cache():
-    Page.objects.clear_url_cache()
-    Page.objects.clear_navbar_cache()
-    Page.objects.clear_breadcrumbs_cache()
+# The fields that show up in the urls, navbars or breadcrumbs for the
+# descendants of a page. Saving a page without changing these only clears
+# the cache for the page itself.
+SUBTREE_FIELDS = ('slug', 'parent_id', 'title', 'short_title', 'state',
+                  'show_in_nav', 'redirect')
+
+
+def _clear_cache(keys=None):
+    """ See ``PageManager.invalidate()`` """
+    Page.objects.invalidate(keys)
+
+
+def clear_response_cache(sender, **kwargs):
+    """
+    Clears the cached responses when page content is saved or deleted,
+    once the changes are committed. This is connected to all the content
+    models when the app is ready.
+    """
+    transaction.on_commit(bump_response_generation)
 
 
 # Models
@@ -44,6 +65,12 @@ class Page(MPTTModel):
 
     template = models.CharField(_("Template"), max_length=250)
 
+    # The slugs for all the ancestors and the page itself, eg. ``a/b/c``.
+    # This is kept up to date when pages are saved or moved, and pages
+    # that would make it longer than ``max_length`` can't be saved.
+    path = models.CharField(
+        _("Path"), max_length=255, db_index=True, editable=False)
+
     redirect = models.CharField(
         _("Redirect"), max_length=200, blank=True, null=True,
         help_text=_("Use this to point to redirect to another page or "
@@ -80,6 +107,16 @@ class Page(MPTTModel):
     def __unicode__(self):
         return '%s' % self.title
 
+    def clean(self):
+        if not self.slug:
+            return  # The slug is required, and validated on it's own
+
+        self.path = self.build_path()
+        old_page = Page.objects.filter(id=self.id).first() if self.id else None
+        self.check_path_length(
+            old_page and old_page.path,
+            old_page and old_page.get_descendants())
+
     def save(self, *args, **kwargs):
         now = timezone.now()
 
@@ -92,20 +129,127 @@ class Page(MPTTModel):
                 self.publish_date = now
 
         self.modified_date = now
+        self.path = self.build_path()
+
+        # Hold on to the cache keys for the page as it is in the database,
+        # since these will change if the page was renamed or moved.
+        old_page, old_keys, subtree_changed = None, [], False
+        if self.id:
+            old_page = Page.objects.filter(id=self.id).first()
+            if old_page:
+                old_keys = Page.objects.get_cache_keys(
+                    old_page, descendants=False)
+                subtree_changed = any(
+                    getattr(old_page, f) != getattr(self, f)
+                    for f in SUBTREE_FIELDS)
+
+        self.check_path_length(
+            old_page and old_page.path,
+            old_page and old_page.get_descendants())
 
         page = super(Page, self).save(*args, **kwargs)
 
-        # Make sure to clear the url, navbar and breadcrumbs cache
-        _clear_cache()
+        if old_page:
+            Page.objects.update_descendant_paths(self, old_page.path)
+
+        # Make sure to clear the url, navbar and breadcrumbs cache. We only
+        # need to clear the cache for this part of the tree, unless the
+        # page was moved to, or from the root level. In that case the
+        # tree ids for all the trees might have changed.
+        # The descendants are only read once, after the save, and only if
+        # the changes show up for the descendants as well.
+        keys = Page.objects.get_cache_keys(
+            self, descendants=subtree_changed,
+            old_path=old_page.path if old_page else None)
+
+        if keys is None or (
+                old_page and old_page.parent_id != self.parent_id and
+                None in (old_page.parent_id, self.parent_id)):
+            keys = None
+        else:
+            keys += old_keys
+
+        # Only clear the cache once the changes are committed, otherwise
+        # another request could cache the pages (or rebuild the page index)
+        # as they were before the save, after the cache was cleared.
+        transaction.on_commit(lambda: _clear_cache(keys))
+
         return page
 
+    def move_to(self, target, position='first-child'):
+        """
+        Moves the page, and clears the cache for the pages that moved once
+        the transaction is committed. To move several pages, use
+        ``Page.objects.move_pages()``, which clears the cache once for all
+        of the moves.
+        """
+        with transaction.atomic():
+            keys = Page.objects.move_page(self, target, position)
+            transaction.on_commit(lambda: _clear_cache(keys))
+
+    def _move_to(self, target, position):
+        """
+        Moving a page doesn't call ``save()``, so we need to update the
+        path for the page and it's descendants here as well. Call this
+        in a transaction, since the page is already moved when the path
+        turns out to be too long.
+        """
+        old_path = self.path
+        super(Page, self).move_to(target, position)
+
+        self.path = self.build_path()
+        try:
+            self.check_path_length(old_path, self.get_descendants())
+        except ValidationError as e:
+            raise InvalidMove(e.messages[0])
+
+        Page.objects.filter(id=self.id).update(path=self.path)
+        Page.objects.update_descendant_paths(self, old_path)
+
+    def build_path(self):
+        """ Returns the path for the page, based on the path of it's parent """
+        if not self.parent_id:
+            return self.slug
+
+        parent_path = Page.objects.filter(id=self.parent_id).values_list(
+            'path', flat=True).first()
+        return '%s/%s' % (parent_path, self.slug)
+
+    def check_path_length(self, old_path=None, descendants=None):
+        """
+        Raises a ``ValidationError`` when the path for the page won't fit in
+        the ``path`` field. If the path changed from ``old_path``, the paths
+        for ``descendants`` are checked as well.
+        """
+        max_length = self._meta.get_field('path').max_length
+        length = len(self.path)
+
+        if old_path is not None and old_path != self.path and \
+                descendants is not None:
+            longest = descendants.aggregate(
+                longest=Max(Length('path')))['longest']
+            if longest:
+                length = max(length, longest - len(old_path) + len(self.path))
+
+        if length > max_length:
+            raise ValidationError(
+                _("The url for this page, or one of it's sub pages, would be "
+                  "longer than %(max_length)s characters. Use a shorter "
+                  "slug, or move the page higher up in the tree."),
+                code='path_length', params={'max_length': max_length})
+
     def delete(self, *args, **kwargs):
         """
         When a page is deleted we need to remove it's items from the
         url and navbar cache.
         """
-        _clear_cache()
+        # Deleting a page doesn't change the tree ids for the other trees,
+        # so only the cache for this part of the tree (and the home url, for
+        # a root page) needs to be cleared.
+        keys = Page.objects.get_cache_keys(self)
+
         super(Page, self).delete(*args, **kwargs)
+        transaction.on_commit(lambda: _clear_cache(keys))
 
     def get_short_title(self):
         if self.short_title:
@@ -118,10 +262,20 @@ class Page(MPTTModel):
         """ A seperate method to specifically deal with permalinks """
         return data
 
+    @instrumented('get_absolute_url')
     def get_absolute_url(self, clear_cache=False):
-        """ Cycle through the parents and generate the path """
-        cache = caches[PAGES_SETTINGS['CACHE_NAME']]
-        cache_key = 'ostinato:pages:page:%s:url' % self.id
+        """
+        Returns the url for the page. The url is memoized for the rest of
+        the request, see ``ostinato.pages.memo``.
+        """
+        return memo.memoize(
+            ('url', self.id), lambda: self._get_absolute_url(clear_cache),
+            refresh=clear_cache)
+
+    def _get_absolute_url(self, clear_cache=False):
+        cache = get_cache()
+        generation = get_generation()
+        cache_key = make_key('page:%s:url' % self.id, generation)
 
         if clear_cache:
             cache.delete(cache_key)
@@ -132,24 +286,17 @@ class Page(MPTTModel):
             if self.redirect:
                 return self.redirect
 
-            if self.is_root_node() and self == Page.objects.root_nodes()[0]:
-                url = reverse('ostinato_page_home')
-
-            else:
-                path = list(self.get_ancestors().values_list('slug', flat=True))
-                path.append(self.slug)
-                url = self.perma_url(('ostinato_page_view', None, {
-                    'path': '/'.join(path)
-                }))
+            url = get_page_url(self.path, self.tree_id, self.level)
 
-            # Set the cache to timeout after a month
-            cache.set(cache_key, url, 60 * 60 * 24 * 7 * 4)
-
-        # Now that we have the url, we should also cache the path lookup.
-        # This is used by the PageManager.objects.get_from_path() to discover
-        # a page based on the url path.
-        url_cache_key = 'ostinato:pages:page_for_path:%s' % url
-        cache.set(url_cache_key, self, 60 * 60 * 24 * 7 * 4)
+            # Now that we have the url, we should also cache the path
+            # lookup. This is used by the PageManager.get_from_path() to
+            # discover a page based on the url path. Only the page id is
+            # cached for the path.
+            url_cache_key = make_key('page_for_path:%s' % url, generation)
+            cache.set_many({
+                cache_key: url,
+                url_cache_key: self.id,
+            }, CACHE_TIMEOUT)
 
         return url
 
@@ -163,18 +310,25 @@ class Page(MPTTModel):
         from ostinato.pages.registry import page_content
         return page_content.get_content_model(self.template)
 
+    @instrumented('get_content')
     def get_content(self):
         """
         Returns the content for this page or None if it doesn't exist.
+        The content is memoized for the rest of the request, so other
+        instances of the same page will not query it again.
         """
         if not self._contents:
-            obj_model = self.get_content_model()
-            try:
-                self._contents = obj_model.objects.get(page=self.id)
-            except obj_model.DoesNotExist:
-                self._contents = 'empty'
+            self._contents = memo.memoize(
+                ('content', self.id), self._load_content)
         return self._contents
 
+    def _load_content(self):
+        obj_model = self.get_content_model()
+        try:
+            return obj_model.objects.get(page=self.id)
+        except obj_model.DoesNotExist:
+            return 'empty'
+
     contents = property(get_content)
 
     def get_template(self):
@@ -199,11 +353,19 @@ class PageContent(models.Model):
         ``template`` is the template path relative the templatedirs.
         ``view`` is a custom view that will handle the rendering for the page.
         ``form`` a custom form to use in the admin.
+        ``cache_response`` set this to False to never cache the response
+        for the page, when ``CACHE_RESPONSES`` is enabled, and to never
+        answer conditional requests for it.
+        ``conditional_response`` set this to True or False to answer
+        conditional requests for the page, or not, regardless of the
+        ``CONDITIONAL_RESPONSES`` setting.
         """
         template = None
         view = 'ostinato.pages.views.PageView'
         form = None
         admin_inlines = []
+        cache_response = True
+        conditional_response = None
 
     @classmethod
     def get_template(cls):
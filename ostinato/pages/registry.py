@@ -1,3 +1,7 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from django.utils.translation import get_language
+
 from appregister import SortedRegistry
 
 
@@ -5,7 +9,50 @@ class ContentRegister(SortedRegistry):
     base = 'ostinato.pages.models.PageContent'
     discovermodule = 'models'
 
+    def setup(self):
+        super(ContentRegister, self).setup()
+        self.reset_index()
+
+    def add_class(self, class_):
+        super(ContentRegister, self).add_class(class_)
+        self.reset_index()
+
+    def remove_class(self, class_):
+        super(ContentRegister, self).remove_class(class_)
+        self.reset_index()
+
+    def reset_index(self):
+        """
+        Forget the content model index, template choices, views and admin
+        inlines. This is called whenever a content model is registered or
+        unregistered.
+        """
+        self._models = None
+        self._choices = {}
+        self._names = {}
+        self._views = {}
+        self._inlines = {}
+
+    def build_index(self):
+        """
+        Maps every template id to it's content model. This is called when
+        the app is ready, or on the first lookup after the registry changed.
+        """
+        models = {}
+        for v in self.all():
+            content_type = '%s.%s' % (v._meta.app_label, v.__name__)
+            models[content_type.lower()] = v
+
+        self._models = models
+        return models
+
     def get_template_choices(self):
+        # The verbose names are translated, so the choices are cached for
+        # every language.
+        language = get_language()
+        if language in self._choices:
+            return self._choices[language]
+
         template_choices = (('', '--------'),)
 
         for v in self.all():
@@ -14,24 +61,127 @@ class ContentRegister(SortedRegistry):
             verbose_name = '%s | %s' % (verbose_app_name, v._meta.verbose_name)
             template_choices += ((content_type.lower(), verbose_name.title()), )
 
+        self._choices[language] = template_choices
+        self._names[language] = dict(template_choices)
         return template_choices
 
     def get_template_name(self, template_id):
-        choices = self.get_template_choices()
+        self.get_template_choices()
+        return self._names[get_language()].get(template_id, template_id)
 
-        for c in choices:
-            if c[0] == template_id:
-                return c[1]
+    def get_content_model(self, template_id):
+        models = self._models
+        if models is None:
+            models = self.build_index()
+        return models.get(template_id)
 
-        return template_id
+    def get_view(self, content_model):
+        """
+        Returns the view for ``content_model``. The view is resolved from
+        ``ContentOptions.view`` only once, and is called as
+        ``view(request, page, *args, **kwargs)``.
+        """
+        view = self._views.get(content_model)
+        if view is None:
+            view = self._views[content_model] = self.load_view(content_model)
+        return view
 
-    def get_content_model(self, template_id):
-        for v in self.all():
-            content_type = '%s.%s' % (v._meta.app_label.lower(),
-                                      v.__name__.lower())
-            if content_type == template_id:
-                return v
+    def load_view(self, content_model):
+        from ostinato.pages.views import PageView
 
+        view_path = getattr(content_model.ContentOptions, 'view',
+                            'ostinato.pages.views.PageView')
+        try:
+            v = import_string(view_path)
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                'Could not import the view "%s" for %s: %s' % (
+                    view_path, content_model.__name__, e))
 
-page_content = ContentRegister()
+        if isinstance(v, type) and issubclass(v, PageView):
+            # PageView can build a view function that takes the page, so we
+            # only need to build it once.
+            view = v.as_page_view()
+
+        elif hasattr(v, 'as_view'):
+            # Some other class based view, which needs the page when the
+            # view function is created.
+            def view(request, page, *args, **kwargs):
+                return v.as_view(page=page)(request, *args, **kwargs)
+
+        else:
+            # Doesn't look like this is a class based view. Treat it as a
+            # traditional function based view
+            def view(request, page, *args, **kwargs):
+                kwargs.update({'page': page, 'template': page.get_template()})
+                return v(request, *args, **kwargs)
 
+        return view
+
+    def build_views(self):
+        """
+        Resolves the views for all the content models. This is called when
+        the app is ready, so that a bad view path fails on startup.
+        """
+        for content_model in self.all():
+            self.get_view(content_model)
+
+    def get_inlines(self, content_model):
+        """
+        Returns the admin inline classes for ``content_model``; The inline
+        for the content itself, followed by the ``ContentOptions.admin_inlines``.
+        These are created only once.
+        """
+        inlines = self._inlines.get(content_model)
+        if inlines is None:
+            inlines = self._inlines[content_model] = \
+                self.load_inlines(content_model)
+        return inlines
+
+    def load_inlines(self, content_model):
+        from django.contrib import admin
+
+        options = content_model.ContentOptions
+
+        def load(path, what):
+            try:
+                return import_string(path)
+            except ImportError as e:
+                raise ImproperlyConfigured(
+                    'Could not import the %s "%s" for %s: %s' % (
+                        what, path, content_model.__name__, e))
+
+        content_form = getattr(options, 'form', None)
+
+        class PageContentInline(admin.StackedInline):
+            model = content_model
+            extra = 1
+            max_num = 1
+            can_delete = False
+            fk_name = 'page'
+            classes = ('grp-collapse grp-open',)
+            inline_classes = ('grp-collapse grp-open',)
+
+            if content_form:
+                form = load(content_form, 'form')
+
+        inlines = [PageContentInline]
+
+        for inline_def in getattr(options, 'admin_inlines', []):
+            if not isinstance(inline_def, basestring):
+                # A (inline, through model) tuple
+                inline_def = inline_def[0]
+            inlines.append(load(inline_def, 'admin inline'))
+
+        return tuple(inlines)
+
+    def build_inlines(self):
+        """
+        Creates the admin inlines for all the content models. Like
+        ``build_views()``, this is called when the app is ready.
+        """
+        for content_model in self.all():
+            self.get_inlines(content_model)
+
+
+page_content = ContentRegister()
@@ -0,0 +1,45 @@
+// Search for the parent page, instead of choosing it from every page
+django.jQuery(document).ready(function($) {
+    $('.vPageParentField').each(function() {
+        var field = $(this);
+        var search = field.next('.vPageParentSearch');
+        var results = search.next('.page-parent-results');
+        var timeout;
+
+        function showResults(pages) {
+            results.empty();
+            $.each(pages, function(i, page) {
+                $('<li>')
+                    .text(page.title + ' (/' + page.path + '/)')
+                    .css({'cursor': 'pointer', 'padding-left': page.level * 12})
+                    .click(function() {
+                        field.val(page.id);
+                        search.val($(this).text());
+                        results.empty();
+                    })
+                    .appendTo(results);
+            });
+        }
+
+        search.on('input', function() {
+            var query = search.val();
+            clearTimeout(timeout);
+
+            // Clearing the search makes this a root page
+            if (!query) {
+                field.val('');
+                results.empty();
+                return;
+            }
+
+            timeout = setTimeout(function() {
+                $.getJSON(field.data('search-url'), {
+                    q: query,
+                    exclude: field.data('exclude') || ''
+                }, function(data) {
+                    showResults(data.results);
+                });
+            }, 250);
+        });
+    });
+});
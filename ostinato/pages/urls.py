@@ -1,5 +1,6 @@
 from django.conf.urls import url
-from ostinato.pages.views import page_dispatch, PageReorderView, PageDuplicateView
+from ostinato.pages.views import (
+    page_dispatch, PageReorderView, PageMoveView, PageDuplicateView)
 
 
 urlpatterns = [
@@ -8,6 +9,9 @@ urlpatterns = [
     url(r'^page_reorder/$', PageReorderView.as_view(),
         name='ostinato_page_reorder'),
 
+    url(r'^page_move/$', PageMoveView.as_view(),
+        name='ostinato_page_move'),
+
     url(r'^page_duplicate/$', PageDuplicateView.as_view(),
         name='ostinato_page_duplicate'),
 
@@ -1,76 +1,231 @@
+import hashlib
+import json
+
 from django.views.generic import View, TemplateView
-from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django.core.urlresolvers import reverse
 from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag, unquote_etag
+from django.utils.translation import get_language
 from django.conf import settings
 from django import http
 
+from mptt.exceptions import InvalidMove
+
 from ostinato.pages.models import Page
+from ostinato.pages.managers import HOME_TREE_ID
 from ostinato.pages.workflow import get_workflow
+from ostinato.pages.index import page_index
+from ostinato.pages.registry import page_content
+from ostinato.pages.cache import (
+    get_cache, make_response_key, get_response_generation)
+from ostinato.pages import PAGES_SETTINGS
 from ostinato.pages.forms import MovePageForm, DuplicatePageForm
 
 
-def page_dispatch(request, *args, **kwargs):
+def resolve_page_entry(kwargs):
     """
-    This is our main entry-point for pages. From here we will determine
-    what page we are working with, check if that page has a custom view.
-
-    If the page has a custom view, we will dispatch to that view, otherwise
-    we will use our default ``PageView``
+    Returns the page index entry for the ``page_dispatch`` url kwargs, or
+    None if there is no page for the url on the current site.
     """
     PAGES_SITE_TREEID = getattr(settings, 'OSTINATO_PAGES_SITE_TREEID', None)
 
-    ## Some basic page checking and authorization
     if 'path' in kwargs:
-        if kwargs['path'][-1] == '/':
-            path = kwargs['path'][:-1].split('/')
-        else:
-            path = kwargs['path'].split('/')
+        entry = page_index.get(kwargs['path'])
 
-        if PAGES_SITE_TREEID:
-            page = get_object_or_404(Page, slug=path[-1], tree_id=PAGES_SITE_TREEID)
-        else:
-            page = get_object_or_404(Page, slug=path[-1])
+        if entry and PAGES_SITE_TREEID and entry.tree_id != PAGES_SITE_TREEID:
+            entry = None
 
     else:
         # If we are looking at the root path, show the root page for the current site
-        if PAGES_SITE_TREEID:
-            page = get_object_or_404(Page, tree_id=PAGES_SITE_TREEID, level=0)
-        else:
-            page = get_object_or_404(Page, tree_id=1, level=0)
+        entry = page_index.get_root(PAGES_SITE_TREEID or HOME_TREE_ID)
+
+    return entry
+
+
+def page_dispatch(request, *args, **kwargs):
+    """
+    This is our main entry-point for pages. From here we will determine
+    what page we are working with, check if that page has a custom view.
 
-    sm = get_workflow()(instance=page)
+    If the page has a custom view, we will dispatch to that view, otherwise
+    we will use our default ``PageView``
+    """
+    ## Serve the response from the cache if we can. Requests with a query
+    ## string are never cached, since every different query string would
+    ## add another response to the cache, and neither are requests from
+    ## visitors with a session or pending messages.
+    response_key = None
+    if PAGES_SETTINGS['CACHE_RESPONSES'] and \
+            request.method in ('GET', 'HEAD') and \
+            not request.META.get('QUERY_STRING') and \
+            not _has_visitor_state(request) and \
+            not request.user.is_authenticated():
+        response_key = make_response_key(request)
+        response = get_cache().get(response_key)
+        if response is not None:
+            return _conditional_response(request, response)
+
+    ## Resolve the page from the page index, without touching the database.
+    ## The entry is kept on the request for the ``SamplingProfileMiddleware``.
+    entry = request._page_entry = resolve_page_entry(kwargs)
+    if not entry:
+        raise http.Http404
+
+    ## Some basic page checking and authorization
+    sm = get_workflow()(instance=entry)
     has_perm = request.user.has_perm('pages.private_view')
     if not request.user.is_superuser and sm.state == 'Private' and not has_perm:
         return http.HttpResponseForbidden()
 
+    page = Page.objects.get_page(entry.id)
+    if not page:
+        raise http.Http404
+
+    ## Dispatch to the view for the page content, see ``ContentOptions.view``
     content = page.get_content_model()
 
-    ## Check if the page has a custom view
-    if hasattr(content.ContentOptions, 'view'):
-        module_path, view_class = content.ContentOptions.view.rsplit('.', 1)
+    ## Answer conditional requests before rendering the page, if enabled for
+    ## the content, and unless the content opted out of caching, eg.
+    ## because it's different every time. Pages for visitors with a session
+    ## or messages could show something other than the page content.
+    cacheable = getattr(content.ContentOptions, 'cache_response', True)
+    conditional = getattr(content.ContentOptions, 'conditional_response', None)
+    if conditional is None:
+        conditional = PAGES_SETTINGS['CONDITIONAL_RESPONSES']
 
-        # Import our custom view
-        v = __import__(module_path, locals(), globals(), [view_class], -1)\
-            .__dict__[view_class]
+    etag = None
+    if cacheable and conditional and request.method in ('GET', 'HEAD') and \
+            not _has_visitor_state(request):
+        etag = _get_page_etag(request, page, content)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
 
-        if hasattr(v, 'as_view'):
-            return v.as_view(page=page)(request, *args, **kwargs)
-        else:
-            # Doesn't look like this is a class based view. Treat it as a
-            # traditional function based view
-            kwargs.update({'page': page, 'template': page.get_template()})
-            return v(request, *args, **kwargs)
+    view = page_content.get_view(content)
+    response = view(request, page, *args, **kwargs)
+
+    if etag and response.status_code == 200 and \
+            not response.has_header('ETag'):
+        response['ETag'] = quote_etag(etag)
+
+    if response_key and request.method == 'GET' and cacheable:
+        _cache_response(request, response, response_key)
+
+    return response
+
+
+def _get_page_etag(request, page, content_model):
+    """
+    Returns the etag for the page response. This is based on the
+    ``modified_date`` of the page and it's content (if the content model
+    has a ``modified_date`` field), along with the response cache
+    generation, since a rendered page can show navbars and content for other
+    pages as well. The language and user are included, since the page could
+    be different for those.
+
+    There is no Last-Modified validator, since saving any other page can
+    change this page, without changing it's own ``modified_date``.
+    """
+    stamps = [page.modified_date]
+
+    try:
+        content_model._meta.get_field('modified_date')
+    except FieldDoesNotExist:
+        pass
+    else:
+        content = page.get_content()
+        if content != 'empty':
+            stamps.append(content.modified_date)
+
+    return hashlib.md5(':'.join(str(v) for v in [
+        page.id, get_response_generation(), get_language(),
+        request.user.pk] + [s.isoformat() for s in stamps if s])).hexdigest()
+
+
+def _conditional_response(request, response):
+    """ Returns a 304 response for a cached response, if we can """
+    etag = response.get('ETag')
+    if etag:
+        etag = unquote_etag(etag)
+
+    return get_conditional_response(
+        request, etag=etag, response=response) or response
+
+
+def _has_visitor_state(request):
+    """
+    Returns True if the response for ``request`` can be specific to the
+    visitor, because they have a session or messages cookie, or because
+    the view changed their session or added messages.
+
+    This is checked instead of ``request.session.accessed``, since checking
+    ``request.user`` always reads the session. Without a session cookie,
+    that session is empty for every visitor.
+    """
+    if settings.SESSION_COOKIE_NAME in request.COOKIES or \
+            CookieStorage.cookie_name in request.COOKIES:
+        return True
+
+    session = getattr(request, 'session', None)
+    if session is not None and session.modified:
+        return True
+
+    messages = getattr(request, '_messages', None)
+    return bool(messages is not None and messages.added_new)
+
+
+def _cache_response(request, response, key):
+    """
+    Caches the response once it is rendered, unless it is specific to the
+    visitor in some way.
 
+    This happens before the response middleware runs, so cookies set by the
+    session and messages middleware are not on the response yet. Those
+    are covered by ``_has_visitor_state()``. Responses with a ``Vary``
+    header are not cached either, since the cache key can't vary with it.
+    """
+    def set_response(response):
+        if response.status_code != 200 or response.streaming or \
+                response.cookies or request.META.get('CSRF_COOKIE_USED') or \
+                response.has_header('Vary') or _has_visitor_state(request):
+            return
+        get_cache().set(
+            key, response, PAGES_SETTINGS['RESPONSE_CACHE_TIMEOUT'])
+
+    if hasattr(response, 'add_post_render_callback'):
+        response.add_post_render_callback(set_response)
     else:
-        return PageView.as_view(page=page)(request, *args, **kwargs)
+        set_response(response)
 
 
 class PageView(TemplateView):
 
     page = None
 
+    @classmethod
+    def as_page_view(cls):
+        """
+        Returns the view function that ``page_dispatch`` calls as
+        ``view(request, page, *args, **kwargs)``. This does the same as
+        ``as_view(page=page)``, so the page is set when the view is created,
+        but the view function is only created once.
+        """
+        def view(request, page, *args, **kwargs):
+            self = cls(page=page)
+            if hasattr(self, 'get') and not hasattr(self, 'head'):
+                self.head = self.get
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return self.dispatch(request, *args, **kwargs)
+
+        view.view_class = cls
+        return view
+
     def get_template_names(self, **kwargs):
         return self.page.get_template()
 
@@ -91,6 +246,43 @@ class PageReorderView(View):
             reverse('admin:ostinato_pages_page_changelist'))
 
 
+class PageMoveView(View):
+    """
+    Moves a batch of pages in a single transaction, eg. after reordering
+    pages with drag and drop. The moves are posted as json, in the order
+    that they should be applied:
+
+        {"moves": [{"node": 2, "target": 1, "position": "left"}, ...]}
+
+    Either all the pages are moved, or none of them are.
+    """
+
+    @method_decorator(staff_member_required)
+    def post(self, request, *args, **kwargs):
+        try:
+            moves = json.loads(request.body)['moves']
+        except (ValueError, KeyError, TypeError):
+            moves = None
+
+        if not isinstance(moves, list) or \
+                not all(isinstance(move, dict) for move in moves):
+            return http.JsonResponse(
+                {'error': 'Expected a list of moves'}, status=400)
+
+        forms = [MovePageForm(move) for move in moves]
+
+        errors = [form.errors for form in forms if not form.is_valid()]
+        if errors:
+            return http.JsonResponse({'errors': errors}, status=400)
+
+        try:
+            Page.objects.move_pages([form.get_move() for form in forms])
+        except (Page.DoesNotExist, InvalidMove) as e:
+            return http.JsonResponse({'error': str(e)}, status=400)
+
+        return http.JsonResponse({'moved': len(forms)})
+
+
 class PageDuplicateView(View):
 
     @method_decorator(staff_member_required)
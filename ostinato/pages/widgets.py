@@ -0,0 +1,54 @@
+from django import forms
+from django.core.urlresolvers import reverse_lazy
+from django.forms.utils import flatatt
+from django.utils.encoding import force_text
+from django.utils.html import format_html
+from django.utils.translation import ugettext_lazy as _
+
+
+class PageParentWidget(forms.Widget):
+    """
+    Selects the parent for a page by searching for it, instead of listing
+    every page as an option. The search results come from ``search_url``,
+    and exclude the page with the id in the ``data-exclude`` attribute,
+    along with it's descendants.
+    """
+
+    class Media:
+        js = (
+            'pages/js/page_parent_widget.js',
+        )
+
+    def __init__(self, attrs=None, search_url=None):
+        super(PageParentWidget, self).__init__(attrs)
+        self.search_url = search_url or reverse_lazy(
+            'admin:ostinato_pages_page_parent_search')
+
+    def label_for_value(self, value):
+        from ostinato.pages.models import Page
+
+        try:
+            title, path = Page.objects.filter(pk=value).values_list(
+                'title', 'path')[0]
+        except (IndexError, ValueError):
+            return ''
+        return '%s (/%s/)' % (title, path)
+
+    def render(self, name, value, attrs=None):
+        if value is None:
+            value = ''
+
+        final_attrs = self.build_attrs(
+            attrs, type='hidden', name=name,
+            value=force_text(value),
+            **{'class': 'vPageParentField',
+               'data-search-url': force_text(self.search_url)})
+
+        return format_html(
+            '<input{} />'
+            '<input type="text" class="vPageParentSearch vTextField" '
+            'value="{}" placeholder="{}" autocomplete="off" />'
+            '<ul class="page-parent-results"></ul>',
+            flatatt(final_attrs),
+            self.label_for_value(value) if value else '',
+            _('Search pages, or leave empty for a root page'))
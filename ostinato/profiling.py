@@ -0,0 +1,179 @@
+"""
+A low overhead sampling profiler for production traffic.
+
+A single background thread looks at the stacks of the threads that are busy
+with a request every few milliseconds. When a request is done the samples
+are either thrown away, or recorded against the view that handled it, if
+the request was picked for sampling or was slower than the threshold. See
+``ostinato.middleware.SamplingProfileMiddleware``.
+
+Stacks are recorded in the "folded" format, which can be turned into a
+flame graph with ``flamegraph.pl``.
+"""
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+
+PROFILE_SETTINGS = {
+    # Profile 1 in every SAMPLE_RATE requests, 0 to disable
+    'SAMPLE_RATE': 0,
+    # Also profile any request that takes longer than this (in seconds)
+    'SLOW_THRESHOLD': None,
+    # Seconds between samples
+    'INTERVAL': 0.005,
+    # Only keep the innermost frames for deep stacks
+    'MAX_DEPTH': 100,
+    # Keep at most this many different stacks for every view. Samples for
+    # any new stacks after that are counted under a single "[other]" stack.
+    'MAX_STACKS': 1000,
+    # Append the folded stacks for every recorded request to this file
+    'OUTPUT_FILE': None,
+}
+PROFILE_SETTINGS.update(getattr(settings, 'OSTINATO_PROFILE_SETTINGS', {}))
+
+
+# The stack that samples are counted under once a view has too many stacks
+OTHER_STACK = ('[other]',)
+
+
+class RequestSamples(object):
+    """ The samples for a single request """
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.label = None
+        self.start = time.time()
+        self.stacks = defaultdict(int)
+
+
+class Sampler(object):
+
+    def __init__(self, interval=None, max_depth=None, max_stacks=None):
+        self.interval = interval or PROFILE_SETTINGS['INTERVAL']
+        self.max_depth = max_depth or PROFILE_SETTINGS['MAX_DEPTH']
+        self.max_stacks = max_stacks or PROFILE_SETTINGS['MAX_STACKS']
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+
+        # label -> {'requests': 0, 'samples': 0, 'stacks': {stack: count}}
+        self.results = {}
+
+    def start(self, thread_id=None):
+        """ Starts collecting samples for the (current) thread """
+        samples = RequestSamples(thread_id or threading.current_thread().ident)
+
+        with self._lock:
+            self._active[samples.thread_id] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.run, name='ostinato-sampler')
+                self._thread.daemon = True
+                self._thread.start()
+
+        return samples
+
+    def stop(self, samples):
+        with self._lock:
+            self._active.pop(samples.thread_id, None)
+
+    def run(self):
+        # The thread stops when there are no requests left to sample, and
+        # is started again by the next request.
+        while self.sample():
+            time.sleep(self.interval)
+
+    def sample(self):
+        """
+        Records the current stack for every thread that is profiled. Returns
+        False when there are no threads to profile.
+        """
+        frames = sys._current_frames()
+
+        with self._lock:
+            if not self._active:
+                self._thread = None
+                return False
+
+            for thread_id, samples in self._active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples.stacks[self.get_stack(frame)] += 1
+
+        return True
+
+    def get_stack(self, frame):
+        """ Returns the stack for ``frame``, from the outermost frame in """
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append('%s:%s(%s)' % (
+                code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+
+        stack.reverse()
+        return tuple(stack)
+
+    def record(self, samples):
+        """
+        Adds the samples for a request to the results for it's view. Once
+        there are ``max_stacks`` different stacks for the view, the samples
+        for new stacks are added to ``OTHER_STACK``, so that the results
+        don't keep growing on a long running process. The ``OUTPUT_FILE``
+        still gets the full stacks.
+        """
+        label = samples.label or 'unknown'
+
+        with self._lock:
+            result = self.results.setdefault(
+                label, {'requests': 0, 'samples': 0, 'stacks': {}})
+            result['requests'] += 1
+
+            stacks = result['stacks']
+            for stack, count in samples.stacks.items():
+                if stack not in stacks and len(stacks) >= self.max_stacks:
+                    stack = OTHER_STACK
+
+                result['samples'] += count
+                stacks[stack] = stacks.get(stack, 0) + count
+
+        if PROFILE_SETTINGS['OUTPUT_FILE']:
+            self.write(label, samples.stacks)
+
+    def write(self, label, stacks):
+        with self._write_lock:
+            with open(PROFILE_SETTINGS['OUTPUT_FILE'], 'a') as f:
+                for line in fold_stacks(label, stacks):
+                    f.write(line + '\n')
+
+    def get_folded(self):
+        """ Returns all the results as folded stacks """
+        with self._lock:
+            lines = []
+            for label, result in sorted(self.results.items()):
+                lines += fold_stacks(label, result['stacks'])
+            return lines
+
+    def get_summary(self):
+        """ Returns the amount of requests and samples for every view """
+        with self._lock:
+            return dict(
+                (label, {'requests': r['requests'], 'samples': r['samples']})
+                for label, r in self.results.items())
+
+    def reset(self):
+        with self._lock:
+            self.results = {}
+
+
+def fold_stacks(label, stacks):
+    return ['%s;%s %s' % (label, ';'.join(stack), count)
+            for stack, count in stacks.items()]
+
+
+sampler = Sampler()
@@ -0,0 +1,34 @@
+"""
+Benchmarks for ostinato, run with ``runbenchmarks.py``.
+
+A benchmark is a function that takes the sample pages for the tree (see
+``trees.get_sample_pages()``), does any preparation that should not be
+timed, and returns the function to time.
+
+Benchmarks registered with ``tree=False`` don't depend on the size of the
+page tree. They take no arguments, and only run once.
+"""
+from collections import namedtuple
+
+
+Benchmark = namedtuple('Benchmark', ['name', 'func', 'repeat', 'number', 'tree'])
+
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=10, number=1, tree=True):
+    """
+    Registers a benchmark function under ``name``. The function being timed
+    is called ``number`` times for each of the ``repeat`` timings, so use a
+    higher ``number`` for very fast functions.
+    """
+    def decorator(func):
+        BENCHMARKS.append(Benchmark(name, func, repeat, number, tree))
+        return func
+    return decorator
+
+
+def load_benchmarks():
+    """ Imports the benchmark modules, which registers the benchmarks """
+    from ostinato.tests.benchmarks import (
+        pages, statemachine, contentfilters, registry)
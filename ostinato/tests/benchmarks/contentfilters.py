@@ -0,0 +1,26 @@
+from ostinato.contentfilters.templatetags.content_filters import modify
+
+from ostinato.tests.benchmarks import benchmark
+
+
+CONTENT = '\n'.join([
+    '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>',
+    '<p>http://www.youtube.com/watch?v=abcdefghijk</p>',
+] * 50 + ['{{{snip}}}'] + [
+    '<p>Sed do eiusmod tempor incididunt ut labore et dolore.</p>',
+] * 50)
+
+
+@benchmark('modify_all', repeat=20, number=100, tree=False)
+def bench_modify_all():
+    return lambda: modify(CONTENT)
+
+
+@benchmark('modify_include', repeat=20, number=100, tree=False)
+def bench_modify_include():
+    return lambda: modify(CONTENT, 'youtube,hide_snip')
+
+
+@benchmark('modify_exclude', repeat=20, number=100, tree=False)
+def bench_modify_exclude():
+    return lambda: modify(CONTENT, '!youtube')
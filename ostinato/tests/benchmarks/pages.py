@@ -0,0 +1,149 @@
+from itertools import cycle
+
+from django.contrib.auth.models import User, AnonymousUser
+from django.core.urlresolvers import reverse
+from django.test import Client
+from django.test.client import RequestFactory
+
+from ostinato.pages import memo
+from ostinato.pages.cache import get_cache
+from ostinato.pages.forms import MovePageForm, DuplicatePageForm
+from ostinato.pages.index import page_index
+from ostinato.pages.models import Page
+from ostinato.pages.views import page_dispatch
+
+from ostinato.tests.benchmarks import benchmark
+
+
+def in_request(func):
+    """ Runs ``func`` with the request memo, like the middleware would """
+    def run():
+        memo.start()
+        try:
+            func()
+        finally:
+            memo.stop()
+    return run
+
+
+def clear_all():
+    get_cache().clear()
+    page_index.invalidate()
+
+
+@benchmark('page_dispatch', repeat=50)
+def bench_page_dispatch(samples):
+    path = samples['leaf'].path
+    rf = RequestFactory()
+
+    def run():
+        request = rf.get('/%s/' % path)
+        request.user = AnonymousUser()
+        page_dispatch(request, path=path).render()
+
+    return in_request(run)
+
+
+@benchmark('page_dispatch_cold')
+def bench_page_dispatch_cold(samples):
+    """ Dispatch with an empty cache, which also rebuilds the page index """
+    dispatch = bench_page_dispatch(samples)
+
+    def run():
+        clear_all()
+        dispatch()
+
+    return run
+
+
+@benchmark('get_navbar', repeat=50)
+def bench_get_navbar(samples):
+    parent = Page.objects.get(id=samples['parent'].id)
+    return in_request(lambda: Page.objects.get_navbar(for_page=parent))
+
+
+@benchmark('get_navbar_uncached')
+def bench_get_navbar_uncached(samples):
+    parent = Page.objects.get(id=samples['parent'].id)
+    return in_request(
+        lambda: Page.objects.get_navbar(for_page=parent, clear_cache=True))
+
+
+@benchmark('get_breadcrumbs_uncached')
+def bench_get_breadcrumbs_uncached(samples):
+    leaf = Page.objects.get(id=samples['leaf'].id)
+    return in_request(
+        lambda: Page.objects.get_breadcrumbs(leaf, clear_cache=True))
+
+
+@benchmark('generate_url_cache', repeat=3)
+def bench_generate_url_cache(samples):
+    return Page.objects.generate_url_cache
+
+
+@benchmark('save_page')
+def bench_save_page(samples):
+    """ Saving a page without changes to the fields its subtree shows """
+    parent = Page.objects.get(id=samples['parent'].id)
+    return parent.save
+
+
+@benchmark('clear_cache')
+def bench_clear_cache(samples):
+    """ Clearing the whole cache, and rebuilding the index afterwards """
+    def run():
+        Page.objects.clear_cache()
+        page_index.invalidate()
+        page_index.refresh()
+
+    return run
+
+
+@benchmark('move_page')
+def bench_move_page(samples):
+    """ Moves a leaf between two parents """
+    leaf = samples['leaf'].id
+    parents = cycle([samples['other_parent'].id, samples['leaf'].parent_id])
+
+    def run():
+        form = MovePageForm({
+            'node': leaf,
+            'target': next(parents),
+            'position': 'first-child',
+        })
+        form.is_valid()
+        form.save()
+
+    return run
+
+
+@benchmark('duplicate_page')
+def bench_duplicate_page(samples):
+    # Every page can only be duplicated once, since the slug has to be unique
+    leaves = iter(samples['leaves'])
+    target = samples['other_parent'].id
+
+    def run():
+        form = DuplicatePageForm({
+            'node': next(leaves).id,
+            'target': target,
+            'position': 'last-child',
+        })
+        form.is_valid()
+        form.save()
+
+    return run
+
+
+@benchmark('admin_changelist', repeat=3)
+def bench_admin_changelist(samples):
+    user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+    client = Client()
+    client.force_login(user)
+    url = reverse('admin:ostinato_pages_page_changelist')
+
+    def run():
+        response = client.get(url)
+        assert response.status_code == 200
+
+    return run
@@ -0,0 +1,36 @@
+from ostinato.pages.registry import page_content
+
+from ostinato.tests.benchmarks import benchmark
+
+
+@benchmark('registry_content_model', repeat=20, number=1000, tree=False)
+def bench_registry_content_model():
+    return lambda: page_content.get_content_model('pages.basicpage')
+
+
+@benchmark('registry_template_choices', repeat=20, number=1000, tree=False)
+def bench_registry_template_choices():
+    return page_content.get_template_choices
+
+
+@benchmark('registry_template_name', repeat=20, number=1000, tree=False)
+def bench_registry_template_name():
+    return lambda: page_content.get_template_name('pages.basicpage')
+
+
+@benchmark('registry_view', repeat=20, number=1000, tree=False)
+def bench_registry_view():
+    content_model = page_content.get_content_model('pages.basicpage')
+    return lambda: page_content.get_view(content_model)
+
+
+@benchmark('registry_rebuild', repeat=20, number=10, tree=False)
+def bench_registry_rebuild():
+    """ Resets the index, like registering a new content model would """
+    def run():
+        page_content.reset_index()
+        page_content.build_index()
+        page_content.get_template_choices()
+        page_content.build_views()
+
+    return run
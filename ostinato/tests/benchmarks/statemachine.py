@@ -0,0 +1,34 @@
+from ostinato.pages.models import Page
+from ostinato.pages.workflow import PageWorkflow
+
+from ostinato.tests.benchmarks import benchmark
+
+
+@benchmark('statemachine_init', repeat=20, number=1000, tree=False)
+def bench_statemachine_init():
+    page = Page(state='private')
+    return lambda: PageWorkflow(instance=page)
+
+
+@benchmark('statemachine_transition', repeat=20, number=1000, tree=False)
+def bench_statemachine_transition():
+    """ Takes a page from private to public and back again """
+    page = Page(state='private')
+
+    def run():
+        sm = PageWorkflow(instance=page)
+        sm.take_action('make_public')
+        sm.take_action('make_private')
+
+    return run
+
+
+@benchmark('statemachine_actions', repeat=20, number=1000, tree=False)
+def bench_statemachine_actions():
+    sm = PageWorkflow(instance=Page(state='public'))
+    return lambda: (sm.state, sm.actions, sm.action_result('make_private'))
+
+
+@benchmark('statemachine_choices', repeat=20, number=1000, tree=False)
+def bench_statemachine_choices():
+    return PageWorkflow.get_choices
@@ -0,0 +1,75 @@
+from django.utils import timezone
+
+from ostinato.pages.models import Page
+from ostinato.tests.pages.models import BasicPage
+
+
+def create_tree(size, depth=4, fan_out=10, template='pages.basicpage'):
+    """
+    Creates ``size`` pages, as trees that are ``depth`` levels deep, with
+    ``fan_out`` children for every page. The tree fields are worked out up
+    front, so all the pages (and their content) are created with
+    ``bulk_create()`` instead of going through mptt one page at a time.
+
+    Returns the list of pages, in tree order.
+    """
+    now = timezone.now()
+    pages = []
+
+    def add_page(parent, tree_id, level, counter):
+        id = len(pages) + 1
+        slug = 'page-%s' % id
+        page = Page(
+            id=id,
+            title='Page %s' % id,
+            slug=slug,
+            path='%s/%s' % (parent.path, slug) if parent else slug,
+            template=template,
+            state='public',
+            created_date=now,
+            modified_date=now,
+            publish_date=now,
+            parent_id=parent.id if parent else None,
+            tree_id=tree_id,
+            level=level,
+            lft=next(counter),
+        )
+        pages.append(page)
+
+        if level < depth - 1:
+            for i in range(fan_out):
+                if len(pages) >= size:
+                    break
+                add_page(page, tree_id, level + 1, counter)
+
+        page.rght = next(counter)
+
+    tree_id = 1
+    while len(pages) < size:
+        add_page(None, tree_id, 0, iter(range(1, size * 2 + 1)))
+        tree_id += 1
+
+    Page.objects.bulk_create(pages)
+    BasicPage.objects.bulk_create(
+        [BasicPage(page_id=p.id, content='Content for %s' % p.title)
+         for p in pages])
+
+    return pages
+
+
+def get_sample_pages(pages):
+    """
+    Returns a dictionary with some interesting pages from the tree, that
+    the benchmarks can work with.
+    """
+    deepest = max(p.level for p in pages)
+    leaves = [p for p in pages if p.rght == p.lft + 1]
+
+    return {
+        'root': pages[0],
+        'parent': next(p for p in pages if p.level == 1),
+        'leaf': next(p for p in leaves if p.level == deepest),
+        'leaves': leaves,
+        # Another parent to move pages to, away from the other samples
+        'other_parent': [p for p in pages if p.level == 1][-1],
+    }
@@ -72,6 +72,7 @@ class BasicPageFunc(ContentMixin, PageContent):
     class ContentOptions:
         template = 'pages/basic_page.html'
         view = 'ostinato.tests.pages.views.functionview'
+        cache_response = False
 
 
 @page_content.register
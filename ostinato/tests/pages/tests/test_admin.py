@@ -0,0 +1,313 @@
+import json
+
+from django.contrib import admin
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.exceptions import ImproperlyConfigured
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ostinato.pages.admin import PageAdmin, content_inline_factory
+from ostinato.pages.models import Page
+from ostinato.pages.registry import page_content
+from ostinato.tests.pages.models import BasicPage, LandingPage, Contributor
+from .utils import *
+from .factories import *
+
+
+class PageChangeListTestCase(TestCase):
+
+    def setUp(self):
+        create_pages()
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(user)
+        self.url = reverse('admin:ostinato_pages_page_changelist')
+
+    def get_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        return len(queries)
+
+    def test_columns(self):
+        Page.objects.filter(slug='page-2').update(state='private')
+        response = self.client.get(self.url)
+        results = response.context['cl'].result_list
+
+        admin = PageAdmin(Page, AdminSite())
+        page = next(p for p in results if p.slug == 'page-2')
+        self.assertEqual('Private', admin.page_state(page))
+        self.assertEqual('Pages | Basic Page', admin.template_name(page))
+
+        # Without the changelist, the columns are still worked out
+        page = Page.objects.get(slug='page-2')
+        self.assertEqual('Private', admin.page_state(page))
+        self.assertEqual('Pages | Basic Page', admin.template_name(page))
+
+    @override_settings(OSTINATO_PAGES_SITE_TREEID=True)
+    def test_constant_queries(self):
+        Site.objects.create(id=2, domain='two.example.com', name='Two')
+        num_queries = self.get_queries()
+
+        for i in range(10):
+            PageFactory.create(template='pages.basicpage')
+        self.assertEqual(num_queries, self.get_queries())
+
+    @override_settings(OSTINATO_PAGES_SITE_TREEID=True)
+    def test_site_names(self):
+        Site.objects.create(id=2, domain='two.example.com', name='Two')
+        response = self.client.get(self.url)
+        admin = PageAdmin(Page, AdminSite())
+
+        titles = dict((p.slug, admin.get_title(p))
+                      for p in response.context['cl'].result_list)
+        self.assertIn('(example.com)', titles['page-1'])
+        self.assertIn('(Two)', titles['page-2'])
+        self.assertIn('(No Site)', titles['func-page'])
+        self.assertNotIn('(', titles['page-3'])
+
+
+class LazyTreeTestCase(TestCase):
+
+    def setUp(self):
+        create_pages()
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(user)
+        self.url = reverse('admin:ostinato_pages_page_changelist')
+
+        self.admin = admin.site._registry[Page]
+        self.admin.lazy_tree = True
+
+    def tearDown(self):
+        self.admin.lazy_tree = False
+
+    def get_slugs(self, response):
+        return [p.slug for p in response.context['cl'].result_list]
+
+    def test_root_pages_only(self):
+        response = self.client.get(self.url)
+        self.assertEqual(['page-1', 'page-2', 'func-page'],
+                         self.get_slugs(response))
+        self.assertContains(response, 'children-url="%s"' % reverse(
+            'admin:ostinato_pages_page_children',
+            args=(Page.objects.get(slug='page-1').id,)))
+
+    def test_search_lists_all_pages(self):
+        response = self.client.get(self.url, {'q': 'page'})
+        self.assertIn('page-3', self.get_slugs(response))
+
+        response = self.client.get(self.url, {'state__exact': 'public'})
+        self.assertIn('page-3', self.get_slugs(response))
+
+    def test_not_lazy(self):
+        self.admin.lazy_tree = False
+        response = self.client.get(self.url)
+        self.assertIn('page-3', self.get_slugs(response))
+        self.assertNotContains(response, 'children-url')
+
+    def test_children(self):
+        parent = Page.objects.get(slug='page-1')
+        child = PageFactory.create(
+            title='Page 5', slug='page-5', parent=Page.objects.get(slug='page-3'),
+            template='pages.basicpage')
+
+        response = self.client.get(reverse(
+            'admin:ostinato_pages_page_children', args=(parent.id,)))
+        data = json.loads(response.content)
+
+        self.assertEqual(parent.id, data['parent'])
+        self.assertEqual(1, len(data['children']))
+
+        page = data['children'][0]
+        page_3 = Page.objects.get(slug='page-3')
+        self.assertEqual(page_3.id, page['id'])
+        self.assertEqual(1, page['level'])
+        self.assertEqual(1, page['descendant_count'])
+        self.assertIn('<tr>', page['html'])
+        self.assertIn('children-url="%s"' % reverse(
+            'admin:ostinato_pages_page_children', args=(page_3.id,)),
+            page['html'])
+
+        # The grandchild is only loaded for page 3
+        response = self.client.get(reverse(
+            'admin:ostinato_pages_page_children', args=(page_3.id,)))
+        self.assertEqual(
+            [child.id], [c['id'] for c in json.loads(response.content)['children']])
+
+    def test_children_not_found(self):
+        response = self.client.get(reverse(
+            'admin:ostinato_pages_page_children', args=(999,)))
+        self.assertEqual(404, response.status_code)
+
+    def test_children_requires_staff(self):
+        self.client.logout()
+        response = self.client.get(reverse(
+            'admin:ostinato_pages_page_children',
+            args=(Page.objects.get(slug='page-1').id,)))
+        self.assertEqual(302, response.status_code)
+
+
+class ParentSelectTestCase(TestCase):
+
+    def setUp(self):
+        create_pages()
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(user)
+        self.search_url = reverse('admin:ostinato_pages_page_parent_search')
+
+    def search(self, **params):
+        response = self.client.get(self.search_url, params)
+        return [p['path'] for p in json.loads(response.content)['results']]
+
+    def test_change_form_renders_no_options(self):
+        page = Page.objects.get(slug='page-3')
+        response = self.client.get(reverse(
+            'admin:ostinato_pages_page_change', args=(page.id,)))
+
+        self.assertContains(response, 'class="vPageParentField"')
+        self.assertContains(response, 'data-exclude="%s"' % page.id)
+        self.assertContains(response, 'Page 1 (/page-1/)')
+        self.assertNotContains(response, '<option value="%s"' % page.parent_id)
+
+    def test_add_form(self):
+        # The excluded page from the change form shouldn't leak to other forms
+        self.client.get(reverse('admin:ostinato_pages_page_change',
+                                args=(Page.objects.get(slug='page-3').id,)))
+
+        response = self.client.get(reverse('admin:ostinato_pages_page_add'))
+        self.assertContains(response, 'class="vPageParentField"')
+        self.assertNotContains(response, 'data-exclude')
+
+    def test_descendant_is_not_a_valid_parent(self):
+        from ostinato.pages.admin import PageAdminForm
+
+        page = Page.objects.get(slug='page-1')
+        child = Page.objects.get(slug='page-3')
+        form = PageAdminForm(instance=page)
+        self.assertFalse(
+            form.fields['parent'].queryset.filter(id=child.id).exists())
+        self.assertFalse(
+            form.fields['parent'].queryset.filter(id=page.id).exists())
+
+    def test_search(self):
+        self.assertEqual(
+            ['page-1', 'page-1/page-3', 'page-2', 'func-page'], self.search())
+        self.assertEqual(['page-1', 'page-1/page-3'], self.search(q='page-1'))
+        self.assertEqual(['page-1/page-3'], self.search(q='page-1/page-3/'))
+        self.assertEqual(['func-page'], self.search(q='Func'))
+
+    def test_search_excludes_subtree(self):
+        page = Page.objects.get(slug='page-1')
+        self.assertEqual(
+            ['page-2', 'func-page'], self.search(exclude=page.id))
+        self.assertEqual([], self.search(q='page-1', exclude=page.id))
+
+        # A page that doesn't exist excludes nothing
+        self.assertEqual(4, len(self.search(exclude=999)))
+
+    def test_search_requires_staff(self):
+        self.client.logout()
+        response = self.client.get(self.search_url)
+        self.assertEqual(302, response.status_code)
+
+
+class ContentInlinesTestCase(TestCase):
+
+    def setUp(self):
+        create_pages()
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(user)
+
+    def get_inline_models(self, response):
+        return [f.formset.model for f in response.context['inline_admin_formsets']]
+
+    def test_change_view_inlines(self):
+        page = Page.objects.get(slug='page-2')
+        response = self.client.get(reverse(
+            'admin:ostinato_pages_page_change', args=(page.id,)))
+        self.assertEqual(
+            [BasicPage, Contributor], self.get_inline_models(response))
+
+        page = Page.objects.get(slug='page-1')
+        response = self.client.get(reverse(
+            'admin:ostinato_pages_page_change', args=(page.id,)))
+        self.assertEqual([LandingPage], self.get_inline_models(response))
+
+        # The shared admin is never changed
+        self.assertEqual((), admin.site._registry[Page].inlines)
+
+    def test_add_view_inlines(self):
+        response = self.client.get(reverse('admin:ostinato_pages_page_add'))
+        self.assertEqual([], self.get_inline_models(response))
+
+    def test_add_page(self):
+        response = self.client.post(reverse('admin:ostinato_pages_page_add'), {
+            'title': 'New Page', 'slug': 'new-page',
+            'template': 'pages.basicpage', 'state': 'public',
+            'publish_date_0': '2016-01-01', 'publish_date_1': '00:00:00',
+        })
+        self.assertEqual(302, response.status_code)
+        self.assertTrue(Page.objects.filter(slug='new-page').exists())
+
+    def get_post_data(self, response):
+        """ Returns the data that the change form would post, unchanged """
+        data = {}
+        forms = [response.context['adminform'].form]
+        for inline in response.context['inline_admin_formsets']:
+            management_form = inline.formset.management_form
+            forms += [management_form] + list(inline.formset.forms)
+
+        for form in forms:
+            for name, field in form.fields.items():
+                value = form[name].value()
+                if value is None:
+                    continue
+                if hasattr(field, 'compress'):
+                    for i, v in enumerate(field.widget.decompress(value)):
+                        data['%s_%s' % (form.add_prefix(name), i)] = v
+                else:
+                    data[form.add_prefix(name)] = value
+        return data
+
+    def test_change_template(self):
+        page = Page.objects.get(slug='page-1')
+        url = reverse('admin:ostinato_pages_page_change', args=(page.id,))
+
+        data = self.get_post_data(self.client.get(url))
+        data['template'] = 'pages.basicpage'
+
+        response = self.client.post(url, data)
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(
+            'pages.basicpage', Page.objects.get(id=page.id).template)
+
+        # The inlines for the new template are shown from now on
+        response = self.client.get(url)
+        self.assertEqual(
+            [BasicPage, Contributor], self.get_inline_models(response))
+
+    def test_inlines_created_once(self):
+        inlines = page_content.get_inlines(BasicPage)
+        self.assertEqual(BasicPage, inlines[0].model)
+        self.assertIs(inlines, page_content.get_inlines(BasicPage))
+        self.assertIs(inlines[0], content_inline_factory(
+            Page.objects.get(slug='page-2')))
+
+    def test_invalid_inline_path(self):
+        class InvalidPage(object):
+            class ContentOptions:
+                admin_inlines = ['ostinato.tests.pages.models.MissingInline']
+
+        with self.assertRaises(ImproperlyConfigured):
+            page_content.load_inlines(InvalidPage)
+
+    def test_invalid_form_path(self):
+        class InvalidPage(object):
+            class ContentOptions:
+                form = 'ostinato.tests.pages.forms.MissingForm'
+
+        with self.assertRaises(ImproperlyConfigured):
+            page_content.load_inlines(InvalidPage)
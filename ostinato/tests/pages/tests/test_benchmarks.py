@@ -0,0 +1,153 @@
+import json
+
+from django.test import TestCase
+
+from ostinato import utils
+from ostinato.pages.models import Page
+from ostinato.tests.benchmarks import BENCHMARKS, load_benchmarks
+from ostinato.tests.benchmarks.trees import create_tree, get_sample_pages
+from ostinato.utils import run_benchmark, percentile, to_json
+
+
+# The queries made by a single call of every benchmark. A change in these
+# is usually a performance regression (or improvement).
+BENCHMARK_QUERIES = {
+    'page_dispatch': 1,
+    'page_dispatch_cold': 2,
+    'get_navbar': 0,
+    'get_navbar_uncached': 1,
+    'get_breadcrumbs_uncached': 1,
+    'generate_url_cache': 1,
+    'save_page': 3,
+    'clear_cache': 1,
+    'move_page': 10,
+    'duplicate_page': 8,
+    'admin_changelist': 4,
+    'statemachine_init': 0,
+    'statemachine_transition': 0,
+    'statemachine_actions': 0,
+    'statemachine_choices': 0,
+    'modify_all': 0,
+    'modify_include': 0,
+    'modify_exclude': 0,
+    'registry_content_model': 0,
+    'registry_template_choices': 0,
+    'registry_template_name': 0,
+    'registry_view': 0,
+    'registry_rebuild': 0,
+}
+
+
+class TreeFactoryTestCase(TestCase):
+
+    def test_create_tree(self):
+        create_tree(60, depth=3, fan_out=4)
+        self.assertEqual(60, Page.objects.count())
+
+        # The tree fields should be the same as when mptt builds them
+        tree = list(Page.objects.values_list('id', 'lft', 'rght', 'level'))
+        Page.objects.rebuild()
+        self.assertEqual(
+            tree, list(Page.objects.values_list('id', 'lft', 'rght', 'level')))
+
+    def test_paths(self):
+        create_tree(20, depth=3, fan_out=4)
+        p = Page.objects.filter(level=2).first()
+        self.assertEqual(
+            '/'.join(p.get_ancestors(include_self=True).values_list(
+                'slug', flat=True)),
+            p.path)
+
+
+class RunBenchmarkTestCase(TestCase):
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(1, percentile(values, 0))
+        self.assertEqual(3, percentile(values, 50))
+        self.assertEqual(5, percentile(values, 100))
+        self.assertEqual(4.5, percentile([1, 2, 3, 4, 5, 6, 7, 8], 50))
+        self.assertAlmostEqual(4.6, percentile(values, 90))
+        self.assertAlmostEqual(1.4, percentile(values, 10))
+
+    def test_stats(self):
+        # Each repeat calls the timer before and after, and the timings are
+        # per call, so this times 1, 4, 2, 5 and 3 seconds per call.
+        times = iter([0, 2, 0, 8, 0, 4, 0, 10, 0, 6])
+        old_timer = utils.timer
+        utils.timer = lambda: next(times)
+        try:
+            result = run_benchmark(lambda: None, repeat=5, number=2,
+                                   count_queries=False, track_memory=False)
+        finally:
+            utils.timer = old_timer
+
+        self.assertEqual(1, result['min'])
+        self.assertEqual(5, result['max'])
+        self.assertEqual(3, result['mean'])
+        self.assertEqual(3, result['median'])
+        self.assertAlmostEqual(2 ** 0.5, result['stdev'])
+        self.assertAlmostEqual(4.6, result['p90'])
+        self.assertAlmostEqual(4.8, result['p95'])
+        self.assertAlmostEqual(4.96, result['p99'])
+        self.assertIsNone(result['queries'])
+        self.assertIsNone(result['memory_peak'])
+
+    def test_memory_peak(self):
+        result = run_benchmark(lambda: [0] * 100000, repeat=1)
+        if utils.tracemalloc is None:
+            self.assertIsNone(result['memory_peak'])
+        else:
+            self.assertGreaterEqual(result['memory_peak'], 100000 * 8)
+
+    def test_calls(self):
+        calls = []
+        result = run_benchmark(lambda: calls.append(1), name='append',
+                               repeat=5, number=3, warmup=2)
+
+        # warmup + repeat * number, and another call to count the queries
+        # and track memory each.
+        expected = 2 + 5 * 3 + 1
+        if result['memory_peak'] is not None:
+            expected += 1
+        self.assertEqual(expected, len(calls))
+
+        self.assertEqual('append', result['name'])
+        self.assertEqual(5, result['repeat'])
+        self.assertEqual(3, result['number'])
+        self.assertTrue(
+            result['min'] <= result['median'] <= result['p95'] <=
+            result['p99'] <= result['max'])
+
+    def test_queries(self):
+        result = run_benchmark(lambda: list(Page.objects.all()), repeat=1)
+        self.assertEqual(1, result['queries'])
+
+        result = run_benchmark(
+            lambda: list(Page.objects.all()), repeat=1, count_queries=False)
+        self.assertIsNone(result['queries'])
+
+    def test_to_json(self):
+        result = run_benchmark(lambda: None, name='noop', repeat=2)
+        data = json.loads(to_json([result], python='2.7'))
+
+        self.assertEqual('2.7', data['python'])
+        self.assertEqual('noop', data['results'][0]['name'])
+
+
+class BenchmarksTestCase(TestCase):
+
+    def setUp(self):
+        load_benchmarks()
+
+    def test_benchmarks_run(self):
+        samples = get_sample_pages(create_tree(60, depth=3, fan_out=4))
+
+        for bench in BENCHMARKS:
+            func = bench.func(samples) if bench.tree else bench.func()
+            result = run_benchmark(func, name=bench.name, repeat=1, number=1)
+            self.assertEqual(
+                BENCHMARK_QUERIES[bench.name], result['queries'], bench.name)
+
+        self.assertEqual(
+            sorted(BENCHMARK_QUERIES), sorted(b.name for b in BENCHMARKS))
@@ -0,0 +1,81 @@
+from django.test import TestCase
+
+from ostinato.pages import memo
+from ostinato.pages.models import Page
+from ostinato.pages.cache import get_cache
+from ostinato.pages.index import page_index, INDEX_VERSION_KEY
+
+from .utils import *
+
+
+class PageIndexTestCase(CommitTestCase):
+
+    def setUp(self):
+        create_pages()
+
+    def test_get_entry_for_path(self):
+        entry = page_index.get('page-1/page-3')
+        self.assertEqual(3, entry.id)
+        self.assertEqual('pages.basicpage', entry.template)
+        self.assertEqual('public', entry.state)
+        self.assertEqual(1, entry.tree_id)
+
+    def test_get_ignores_surrounding_slashes(self):
+        self.assertEqual(3, page_index.get('/page-1/page-3/').id)
+
+    def test_get_invalid_path_returns_none(self):
+        self.assertIsNone(page_index.get('page-2/page-3'))
+        self.assertIsNone(page_index.get('no/pages/here'))
+
+    def test_get_root(self):
+        self.assertEqual('page-2', page_index.get_root(2).path)
+
+    def test_lookup_does_not_query_database(self):
+        page_index.refresh()
+        with self.assertNumQueries(0):
+            page_index.get('page-1/page-3')
+
+    def test_index_rebuilt_after_save(self):
+        p3 = Page.objects.get(slug='page-3')
+        p3.slug = 'page-three'
+        p3.save()
+
+        self.assertIsNone(page_index.get('page-1/page-3'))
+        self.assertEqual(3, page_index.get('page-1/page-three').id)
+
+    def test_index_rebuilt_after_delete(self):
+        Page.objects.get(slug='page-3').delete()
+        self.assertIsNone(page_index.get('page-1/page-3'))
+
+    def test_get_page(self):
+        page_index.refresh()
+        with self.assertNumQueries(0):
+            page = page_index.get_page(3)
+
+        db_page = Page.objects.get(id=3)
+        for field in Page._meta.concrete_fields:
+            self.assertEqual(getattr(db_page, field.attname),
+                             getattr(page, field.attname), field.name)
+        self.assertFalse(page._state.adding)
+        self.assertEqual('page-1', page.parent.slug)
+
+        self.assertIsNone(page_index.get_page(999))
+
+    def test_version_read_once_per_request(self):
+        memo.start()
+        try:
+            version = page_index.get_version()
+            page_index.get('page-1')
+
+            # Another process changing the stamp doesn't rebuild the index
+            # for the rest of this request...
+            get_cache().set(INDEX_VERSION_KEY, 'other', None)
+            with self.assertNumQueries(0):
+                page_index.get('page-1')
+            self.assertEqual(version, page_index.get_version())
+
+            # ...but invalidating the index within the request does
+            page_index.invalidate()
+            self.assertNotEqual(version, page_index.get_version())
+        finally:
+            memo.stop()
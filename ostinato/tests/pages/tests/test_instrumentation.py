@@ -0,0 +1,94 @@
+from django.test import TestCase
+
+from ostinato.pages.models import Page
+from ostinato.pages import PAGES_SETTINGS, instrumentation
+
+from .utils import *
+
+
+class PageInstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        create_pages()
+        instrumentation.start()
+
+    def tearDown(self):
+        if instrumentation.is_active():
+            instrumentation.stop()
+
+    def test_queries_counted_for_call_site(self):
+        p = Page.objects.get(slug='page-1')
+        p.get_content()
+        stats = instrumentation.stop()
+
+        self.assertEqual(1, stats['get_content']['calls'])
+        self.assertEqual(1, stats['get_content']['queries'])
+
+        # Fetching the page is not part of any call site
+        self.assertEqual(1, stats['other']['queries'])
+
+    def test_cache_operations_counted(self):
+        p = Page.objects.get(slug='page-1')
+        Page.objects.get_navbar(for_page=p, clear_cache=True)
+        Page.objects.get_navbar(for_page=p)
+        stats = instrumentation.stop()['get_navbar']
+
+        self.assertEqual(2, stats['calls'])
+        self.assertEqual(1, stats['queries'])
+        self.assertEqual(1, stats['cache_deletes'])
+        self.assertEqual(1, stats['cache_sets'])
+        # The second navbar is read from the cache
+        self.assertEqual(1, stats['cache_misses'])
+        self.assertEqual(
+            stats['cache_gets'], stats['cache_hits'] + stats['cache_misses'])
+
+    def test_nested_call_sites(self):
+        @instrumentation.instrumented('outer')
+        def outer():
+            Page.objects.get(slug='page-1').get_content()
+
+        outer()
+        stats = instrumentation.stop()
+
+        self.assertEqual(1, stats['outer']['queries'])
+        self.assertEqual(1, stats['get_content']['queries'])
+
+    def test_nothing_counted_when_inactive(self):
+        instrumentation.stop()
+        Page.objects.get(slug='page-1').get_content()
+        self.assertFalse(instrumentation.is_active())
+
+
+class PageInstrumentationMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        create_pages()
+        PAGES_SETTINGS['SERVER_TIMING'] = True
+
+    def tearDown(self):
+        PAGES_SETTINGS['SERVER_TIMING'] = False
+
+    def test_server_timing_header(self):
+        middleware = 'ostinato.pages.middleware.PageInstrumentationMiddleware'
+        with self.modify_settings(MIDDLEWARE_CLASSES={'append': middleware}):
+            response = self.client.get('/page-1/')
+
+        self.assertIn('get_content;dur=', response['Server-Timing'])
+
+    def test_signal_sent(self):
+        received = []
+
+        def receiver(sender, request, stats, **kwargs):
+            received.append(stats)
+
+        instrumentation.page_request_instrumented.connect(receiver)
+        middleware = 'ostinato.pages.middleware.PageInstrumentationMiddleware'
+        try:
+            with self.modify_settings(
+                    MIDDLEWARE_CLASSES={'append': middleware}):
+                self.client.get('/page-1/')
+        finally:
+            instrumentation.page_request_instrumented.disconnect(receiver)
+
+        self.assertEqual(1, len(received))
+        self.assertIn('get_content', received[0])
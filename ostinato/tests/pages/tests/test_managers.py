@@ -1,13 +1,20 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.test.client import RequestFactory
 from django.core.cache import caches
+from django.db import transaction
 
+from mptt.exceptions import InvalidMove
+
+from ostinato.pages import managers
+from ostinato.pages.index import page_index
 from ostinato.pages.models import Page
+from ostinato.pages.cache import (
+    make_key, get_generation, get_response_generation)
 
 from .utils import *
 
 
-class PageManagerTestCase(TestCase):
+class PageManagerTestCase(CommitTestCase):
 
     def setUp(self):
         create_pages()
@@ -89,6 +96,26 @@ class PageManagerTestCase(TestCase):
                 expected_nav, Page.objects.get_navbar(
                     for_page=Page.objects.get(slug='page-1'), clear_cache=True))
 
+    def test_get_navbar_constant_queries(self):
+        p = Page.objects.get(slug='page-1')
+        for i in range(5):
+            PageFactory.create(parent=p)
+        p = Page.objects.get(slug='page-1')
+
+        with self.assertNumQueries(1):
+            navbar = Page.objects.get_navbar(for_page=p, clear_cache=True)
+
+        self.assertEqual(6, len(navbar))
+        self.assertEqual('/page-1/page-3/', navbar[0]['url'])
+
+    def test_get_navbar_redirect_url(self):
+        p = Page.objects.get(slug='page-2')
+        p.redirect = 'http://www.example.com'
+        p.save()
+
+        navbar = Page.objects.get_navbar(clear_cache=True)
+        self.assertEqual('http://www.example.com', navbar[1]['url'])
+
     def test_get_breadcrumbs(self):
         expected_crumbs = [{
             'slug': u'page-1',
@@ -103,6 +130,18 @@ class PageManagerTestCase(TestCase):
         self.assertEqual(expected_crumbs, Page.objects.get_breadcrumbs(
             p, clear_cache=True))
 
+    def test_get_breadcrumbs_single_query(self):
+        parent = Page.objects.get(slug='page-3')
+        for i in range(4):
+            parent = PageFactory.create(parent=parent)
+
+        with self.assertNumQueries(1):
+            crumbs = Page.objects.get_breadcrumbs(parent, clear_cache=True)
+
+        self.assertEqual(6, len(crumbs))
+        self.assertEqual('/', crumbs[0]['url'])
+        self.assertEqual(parent.get_absolute_url(), crumbs[-1]['url'])
+
     def test_get_page_from_path(self):
         rf = RequestFactory()
         request = rf.get('/page-1/page-3/')
@@ -115,13 +154,38 @@ class PageManagerTestCase(TestCase):
         request = rf.get('/no/pages/on/path/')
         self.assertIsNone(Page.objects.get_from_path(request.path))
 
+    def test_get_page_from_path_checks_ancestors(self):
+        self.assertIsNone(
+            Page.objects.get_from_path('/page-2/page-3/', clear_cache=True))
+        self.assertIsNone(
+            Page.objects.get_from_path('/page-3/', clear_cache=True))
+
+    def test_get_page_from_path_for_home(self):
+        self.assertEqual(
+            'page-1', Page.objects.get_from_path('/', clear_cache=True).slug)
+
+    def test_get_page_from_path_for_site_home(self):
+        with self.settings(OSTINATO_PAGES_SITE_TREEID=2):
+            self.assertEqual(
+                'page-2',
+                Page.objects.get_from_path('/', clear_cache=True).slug)
+
+    def test_get_page_from_path_single_query(self):
+        with self.assertNumQueries(1):
+            Page.objects.get_from_path('/page-1/page-3/', clear_cache=True)
+
+    def test_get_page_from_path_caches_missing_pages(self):
+        Page.objects.get_from_path('/no/pages/here/', clear_cache=True)
+        with self.assertNumQueries(0):
+            self.assertIsNone(Page.objects.get_from_path('/no/pages/here/'))
+
     def test_generate_url_cache(self):
         cache = caches['default']
-        cache_url = lambda id: cache.get('ostinato:pages:page:%s:url' % id)
+        cache_url = lambda id: cache.get(make_key('page:%s:url' % id))
 
         # Make sure the url cache is empty
         for i in range(3):
-            cache.set('ostinato:pages:page:%s:url' % i, None)
+            cache.set(make_key('page:%s:url' % i), None)
 
         Page.objects.generate_url_cache()
 
@@ -129,9 +193,29 @@ class PageManagerTestCase(TestCase):
         self.assertEqual('/page-2/', cache_url(2))
         self.assertEqual('/page-1/page-3/', cache_url(3))
 
+    def test_get_page_from_path_cached_after_generate_url_cache(self):
+        Page.objects.generate_url_cache()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                'page-3', Page.objects.get_from_path('/page-1/page-3/').slug)
+
+    def test_generate_url_cache_single_query(self):
+        with self.assertNumQueries(1):
+            Page.objects.generate_url_cache()
+
+    def test_generate_url_cache_skips_redirects(self):
+        p = Page.objects.get(slug='page-2')
+        p.redirect = 'http://www.example.com'
+        p.save()
+
+        Page.objects.generate_url_cache()
+        self.assertEqual(None, caches['default'].get(make_key('page:2:url')))
+        self.assertEqual(
+            '/page-1/page-3/', caches['default'].get(make_key('page:3:url')))
+
     def test_clear_url_cache(self):
         cache = caches['default']
-        cache_url = lambda id: cache.get('ostinato:pages:page:%s:url' % id)
+        cache_url = lambda id: cache.get(make_key('page:%s:url' % id))
 
         Page.objects.generate_url_cache()  # Make sure there is a cache
         Page.objects.clear_url_cache()
@@ -140,3 +224,216 @@ class PageManagerTestCase(TestCase):
         self.assertEqual(None, cache_url(2))
         self.assertEqual(None, cache_url(3))
 
+
+    def test_clear_cache_moves_to_new_generation(self):
+        old_key = make_key('page:root:navbar')
+        Page.objects.get_navbar()
+        self.assertIsNotNone(caches['default'].get(old_key))
+
+        Page.objects.clear_cache()
+        self.assertNotEqual(old_key, make_key('page:root:navbar'))
+        self.assertEqual(None, caches['default'].get(make_key('page:root:navbar')))
+
+    def test_save_only_clears_subtree_for_changed_fields(self):
+        cache = caches['default']
+        page_1 = Page.objects.get(slug='page-1')
+        page_3 = Page.objects.get(slug='page-3')
+        crumbs_key = lambda: make_key('page:%s:crumbs' % page_3.id)
+
+        Page.objects.get_breadcrumbs(page_3)
+        self.assertIsNotNone(cache.get(crumbs_key()))
+
+        # The breadcrumbs for the descendants don't include the template
+        page_1.template = 'pages.basicpage'
+        with self.assertNumQueries(2):
+            page_1.save()
+        self.assertIsNotNone(cache.get(crumbs_key()))
+
+        page_1.title = 'Page One'
+        page_1.save()
+        self.assertIsNone(cache.get(crumbs_key()))
+
+    def test_get_cache_keys_for_renamed_page(self):
+        page_3 = Page.objects.get(slug='page-3')
+        keys = Page.objects.get_cache_keys(page_3, old_path='page-1/page-old')
+
+        self.assertIn('page_for_path:/page-1/page-3/', keys)
+        self.assertIn('page_for_path:/page-1/page-old/', keys)
+
+    def test_large_subtree_clears_all(self):
+        self.addCleanup(
+            setattr, managers, 'SUBTREE_KEYS_LIMIT', managers.SUBTREE_KEYS_LIMIT)
+        managers.SUBTREE_KEYS_LIMIT = 0
+
+        page_1 = Page.objects.get(slug='page-1')
+        self.assertIsNone(Page.objects.get_cache_keys(page_1))
+        self.assertIsNotNone(
+            Page.objects.get_cache_keys(page_1, descendants=False))
+
+        generation = get_generation()
+        page_1.title = 'Page One'
+        page_1.save()
+        self.assertNotEqual(generation, get_generation())
+
+
+class PageQuerySetTestCase(TestCase):
+
+    def setUp(self):
+        create_pages()
+
+        parent = Page.objects.get(slug='page-2')
+        for i in range(3):
+            LandingPageFactory.create(page=PageFactory.create(
+                parent=parent, template='pages.landingpage'))
+            BasicPageFactory.create(page=PageFactory.create(
+                parent=parent, template='pages.basicpage'))
+
+        # A page without any content
+        PageFactory.create(parent=parent, template='pages.basicpage')
+
+    def test_prefetch_content(self):
+        parent = Page.objects.get(slug='page-2')
+
+        # One query for the pages, and one for every content model
+        with self.assertNumQueries(3):
+            children = list(parent.get_children().prefetch_content())
+            contents = [p.contents for p in children]
+
+        self.assertEqual(7, len(contents))
+        self.assertEqual('Landing Page Intro', contents[0].intro)
+        self.assertEqual('Some content for the page', contents[1].content)
+        self.assertEqual('empty', contents[-1])
+
+    def test_prefetch_content_is_lazy(self):
+        with self.assertNumQueries(0):
+            qs = Page.objects.filter(parent__slug='page-2').prefetch_content()
+
+        with self.assertNumQueries(0):
+            qs = qs.filter(template='pages.landingpage')
+
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                'Landing Page Intro', list(qs)[0].contents.intro)
+
+    def test_prefetch_content_values_list(self):
+        with self.assertNumQueries(1):
+            list(Page.objects.prefetch_content().values_list('id', flat=True))
+
+
+class MovePagesTestCase(TransactionTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        create_pages()
+        PageFactory.create(
+            title='Page 5', slug='page-5', template='pages.basicpage',
+            parent=Page.objects.get(slug='page-2'))
+
+    def get_page(self, slug):
+        return Page.objects.get(slug=slug)
+
+    def test_move_pages(self):
+        page_1, page_2 = self.get_page('page-1'), self.get_page('page-2')
+        Page.objects.move_pages([
+            (self.get_page('page-3').id, page_2.id, 'last-child'),
+            (self.get_page('page-5'), page_1, 'first-child'),
+        ])
+
+        self.assertEqual('page-2/page-3', self.get_page('page-3').path)
+        self.assertEqual('page-1/page-5', self.get_page('page-5').path)
+        self.assertEqual(
+            ['page-3'], [p.slug for p in self.get_page('page-2').get_children()])
+
+    def test_moves_are_atomic(self):
+        page_1 = self.get_page('page-1')
+        with self.assertRaises(InvalidMove):
+            Page.objects.move_pages([
+                (self.get_page('page-5').id, page_1.id, 'last-child'),
+                (page_1.id, self.get_page('page-3').id, 'last-child'),
+            ])
+
+        self.assertEqual('page-2/page-5', self.get_page('page-5').path)
+
+    def test_cache_cleared_after_commit(self):
+        page_3 = self.get_page('page-3')
+        self.assertEqual('/page-1/page-3/', page_3.get_absolute_url())
+        generation = get_generation()
+
+        with transaction.atomic():
+            Page.objects.move_pages(
+                [(page_3.id, self.get_page('page-2').id, 'last-child')])
+
+            # Nothing is cleared until the transaction is committed
+            self.assertEqual(
+                '/page-1/page-3/', self.get_page('page-3').get_absolute_url())
+
+        self.assertEqual(
+            '/page-2/page-3/', self.get_page('page-3').get_absolute_url())
+
+        # Only the keys for the moved pages were cleared
+        self.assertEqual(generation, get_generation())
+
+    def test_move_to_clears_cache(self):
+        page_3 = self.get_page('page-3')
+        self.assertEqual('/page-1/page-3/', page_3.get_absolute_url())
+        self.assertEqual(page_3.id, page_index.get('page-1/page-3').id)
+
+        with transaction.atomic():
+            page_3.move_to(self.get_page('page-2'), 'last-child')
+            self.assertEqual(
+                '/page-1/page-3/', self.get_page('page-3').get_absolute_url())
+
+        self.assertEqual(
+            '/page-2/page-3/', self.get_page('page-3').get_absolute_url())
+        self.assertIsNone(page_index.get('page-1/page-3'))
+        self.assertEqual(page_3.id, page_index.get('page-2/page-3').id)
+
+    def test_root_moves_clear_all(self):
+        generation = get_generation()
+        Page.objects.move_pages([
+            (self.get_page('page-2').id, self.get_page('page-1').id, 'left'),
+        ])
+        self.assertNotEqual(generation, get_generation())
+
+
+class CommitInvalidationTestCase(TransactionTestCase):
+    """
+    Other processes could rebuild the page index, or cache pages, from the
+    rows as they were before the transaction, so nothing is cleared until
+    the changes are committed.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        create_pages()
+
+    def test_save(self):
+        version = page_index.get_version()
+
+        with transaction.atomic():
+            page = Page.objects.get(slug='page-3')
+            page.slug = 'page-three'
+            page.save()
+            self.assertEqual(version, page_index.get_version())
+
+        self.assertNotEqual(version, page_index.get_version())
+        self.assertEqual(page.id, page_index.get('page-1/page-three').id)
+
+    def test_delete(self):
+        version = page_index.get_version()
+
+        with transaction.atomic():
+            Page.objects.get(slug='page-3').delete()
+            self.assertEqual(version, page_index.get_version())
+
+        self.assertNotEqual(version, page_index.get_version())
+        self.assertIsNone(page_index.get('page-1/page-3'))
+
+    def test_content_save(self):
+        generation = get_response_generation()
+
+        with transaction.atomic():
+            Page.objects.get(slug='page-1').contents.save()
+            self.assertEqual(generation, get_response_generation())
+
+        self.assertNotEqual(generation, get_response_generation())
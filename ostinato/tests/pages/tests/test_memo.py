@@ -0,0 +1,64 @@
+from django.test import TestCase
+
+from ostinato.pages.models import Page
+from ostinato.pages import memo
+
+from .utils import *
+
+
+class PageMemoTestCase(CommitTestCase):
+
+    def setUp(self):
+        create_pages()
+        memo.start()
+
+    def tearDown(self):
+        memo.stop()
+
+    def test_memoize(self):
+        self.assertEqual(1, memo.memoize('key', lambda: 1))
+        self.assertEqual(1, memo.memoize('key', lambda: 2))
+        self.assertEqual(2, memo.memoize('key', lambda: 2, refresh=True))
+
+    def test_nothing_memoized_when_inactive(self):
+        memo.stop()
+        self.assertEqual(1, memo.memoize('key', lambda: 1))
+        self.assertEqual(2, memo.memoize('key', lambda: 2))
+
+    def test_absolute_url_memoized(self):
+        Page.objects.get(slug='page-3').get_absolute_url(clear_cache=True)
+
+        p3 = Page.objects.get(slug='page-3')
+        with self.assertNumQueries(0):
+            self.assertEqual('/page-1/page-3/', p3.get_absolute_url())
+
+    def test_content_memoized_between_instances(self):
+        Page.objects.get(slug='page-1').contents
+
+        p = Page.objects.get(slug='page-1')
+        with self.assertNumQueries(0):
+            self.assertEqual('Page 1 Content', p.contents.content)
+
+    def test_get_page_returns_same_instance(self):
+        self.assertIs(Page.objects.get_page(1), Page.objects.get_page(1))
+
+    def test_navbar_copy_returned(self):
+        navbar = Page.objects.get_navbar(clear_cache=True)
+        navbar.append('extra')
+        self.assertNotIn('extra', Page.objects.get_navbar())
+
+    def test_memo_reset_when_page_saved(self):
+        p3 = Page.objects.get(slug='page-3')
+        p3.get_absolute_url()
+
+        p3.slug = 'page-three'
+        p3.save()
+        self.assertEqual('/page-1/page-three/', p3.get_absolute_url())
+
+
+class PageMemoMiddlewareTestCase(TestCase):
+
+    def test_memo_not_active_after_request(self):
+        create_pages()
+        self.client.get('/page-1/')
+        self.assertFalse(memo.is_active())
@@ -1,7 +1,12 @@
 from django.test import TestCase
 from django.core.cache import caches
+from django.core.exceptions import ValidationError
 
+from mptt.exceptions import InvalidMove
+
+from ostinato.pages.managers import get_page_url
 from ostinato.pages.models import Page
+from ostinato.pages.cache import make_key, get_generation
 from ostinato.pages.registry import page_content
 
 from ostinato.tests.pages.models import *
@@ -42,8 +47,29 @@ class ContentRegistryTestCase(TestCase):
             BasicPage,
             page_content.get_content_model('pages.basicpage'))
 
+    def test_get_model_invalid_id(self):
+        self.assertIsNone(page_content.get_content_model('invalid.content'))
+
+    def test_index_built_when_app_ready(self):
+        self.assertIn('pages.basicpage', page_content._models)
+
+    def test_index_reset_on_register(self):
+        page_content.unregister(OtherPage)
+        try:
+            self.assertIsNone(page_content.get_content_model('pages.otherpage'))
+            self.assertNotIn(
+                'pages.otherpage', dict(page_content.get_template_choices()))
+        finally:
+            page_content.register(OtherPage)
+
+        self.assertEqual(
+            OtherPage, page_content.get_content_model('pages.otherpage'))
+        self.assertEqual(
+            'Pages | Some Other Page',
+            page_content.get_template_name('pages.otherpage'))
 
-class PageModelTestCase(TestCase):
+
+class PageModelTestCase(CommitTestCase):
 
     def setUp(self):
         create_pages()
@@ -70,10 +96,38 @@ class PageModelTestCase(TestCase):
         self.assertEqual('/page-2/', p2.get_absolute_url())
         self.assertEqual('/page-1/page-3/', p3.get_absolute_url())
 
+    def test_path(self):
+        self.assertEqual('page-1', Page.objects.get(slug='page-1').path)
+        self.assertEqual('page-1/page-3', Page.objects.get(slug='page-3').path)
+
+    def test_path_updated_for_descendants(self):
+        p = Page.objects.get(slug='page-1')
+        p.slug = 'page-one'
+        p.save()
+
+        self.assertEqual(
+            'page-one/page-3', Page.objects.get(slug='page-3').path)
+
+    def test_path_updated_after_move_to(self):
+        p3 = Page.objects.get(slug='page-3')
+        PageFactory.create(slug='page-5', parent=p3)
+
+        p3.move_to(Page.objects.get(slug='page-2'), 'first-child')
+        self.assertEqual('page-2/page-3', p3.path)
+        self.assertEqual(
+            'page-2/page-3', Page.objects.get(slug='page-3').path)
+        self.assertEqual(
+            'page-2/page-3/page-5', Page.objects.get(slug='page-5').path)
+
+    def test_absolute_url_does_not_query_ancestors(self):
+        p3 = Page.objects.get(slug='page-3')
+        with self.assertNumQueries(0):
+            p3.get_absolute_url(clear_cache=True)
+
     def test_absolute_url_is_cached(self):
         p3 = Page.objects.get(slug='page-3')
         cache = caches['default']
-        cache_key = 'ostinato:pages:page:3:url'
+        cache_key = make_key('page:3:url')
 
         # First the get_absolute_url should cache the url
         # Lets make sure that this url wasn't previously cached
@@ -81,6 +135,19 @@ class PageModelTestCase(TestCase):
         self.assertEqual('/page-1/page-3/', p3.get_absolute_url())
         self.assertEqual('/page-1/page-3/', cache.get(cache_key))
 
+    def test_absolute_url_caches_page_id_for_path(self):
+        p3 = Page.objects.get(slug='page-3')
+        cache = caches['default']
+        path_key = make_key('page_for_path:/page-1/page-3/')
+
+        p3.get_absolute_url(clear_cache=True)
+        self.assertEqual(3, cache.get(path_key))
+
+        # The path lookup is not written again when the url is cached
+        cache.delete(path_key)
+        p3.get_absolute_url()
+        self.assertEqual(None, cache.get(path_key))
+
     def test_absolute_url_clear_cache(self):
         p3 = Page.objects.get(slug='page-3')
         p3.get_absolute_url(clear_cache=True)
@@ -88,9 +155,9 @@ class PageModelTestCase(TestCase):
     def test_urls_recached_after_page_delete(self):
         p3 = Page.objects.get(slug='page-3')
         cache = caches['default']
-        url_key = 'ostinato:pages:page:3:url'
-        nav_key = 'ostinato:pages:page:3:navbar'
-        crumbs_key = 'ostinato:pages:page:3:crumbs'
+        url_key = make_key('page:3:url')
+        nav_key = make_key('page:3:navbar')
+        crumbs_key = make_key('page:3:crumbs')
 
         # create some dummy cache values
         cache.set(url_key, 'URL Cache Value', 60 * 60 * 24 * 7 * 4)
@@ -110,6 +177,52 @@ class PageModelTestCase(TestCase):
         self.assertEqual(None, cache.get(nav_key))
         self.assertEqual(None, cache.get(crumbs_key))
 
+    def test_root_delete_only_clears_cache_for_tree(self):
+        p1 = Page.objects.get(slug='page-1')
+        p2 = Page.objects.get(slug='page-2')
+        self.assertEqual('/', p1.get_absolute_url())
+        self.assertEqual('/page-2/', p2.get_absolute_url())
+        generation = get_generation()
+
+        # The other trees keep their ids, so page 2 doesn't become the
+        # home page.
+        p1.delete()
+        self.assertEqual(generation, get_generation())
+        self.assertIsNone(caches['default'].get(make_key('page_for_path:/')))
+        self.assertEqual(
+            '/page-2/', Page.objects.get(slug='page-2').get_absolute_url())
+
+    def test_get_page_url(self):
+        self.assertEqual('/', get_page_url(''))
+        self.assertEqual('/', get_page_url('page-1', 1, 0))
+        self.assertEqual('/page-2/', get_page_url('page-2', 2, 0))
+        self.assertEqual('/page-1/page-3/', get_page_url('page-1/page-3', 1, 1))
+        self.assertEqual('/page-1/page-3/', get_page_url(
+            'page-1/page-3', home_url='/'))
+
+    def test_save_only_clears_cache_for_subtree(self):
+        cache = caches['default']
+        for p in Page.objects.all():
+            p.get_absolute_url()
+
+        p = Page.objects.get(slug='page-1')
+        p.title = 'Page 1 Renamed'
+        p.save()
+
+        # Page 1 and it's child are cleared, but page 2 is still cached
+        self.assertEqual(None, cache.get(make_key('page:1:url')))
+        self.assertEqual(None, cache.get(make_key('page:3:url')))
+        self.assertEqual('/page-2/', cache.get(make_key('page:2:url')))
+
+    def test_save_clears_missing_path_for_new_page(self):
+        p = Page.objects.get(slug='page-1')
+        self.assertIsNone(
+            Page.objects.get_from_path('/page-1/page-5/', clear_cache=True))
+
+        Page.objects.create(title='Page 5', slug='page-5', parent=p)
+        self.assertEqual(
+            'page-5', Page.objects.get_from_path('/page-1/page-5/').slug)
+
     def test_urls_updated_after_move(self):
         p = Page.objects.get(slug='page-1')
         p2 = Page.objects.get(slug='page-2')
@@ -156,6 +269,58 @@ class PageModelTestCase(TestCase):
         self.assertEqual(c, p.contents)
 
 
+class PathLengthTestCase(TestCase):
+
+    def setUp(self):
+        # Five levels of 50 character slugs makes a 254 character path
+        self.pages = []
+        parent = None
+        for i in range(5):
+            parent = PageFactory.create(
+                slug=str(i) * 50, parent=parent, template='pages.basicpage')
+            self.pages.append(parent)
+        self.other = PageFactory.create(
+            slug='other', parent=self.pages[0], template='pages.basicpage')
+
+    def get_path(self, page):
+        return Page.objects.get(id=page.id).path
+
+    def test_longest_path(self):
+        self.assertEqual(254, len(self.get_path(self.pages[-1])))
+
+    def test_new_page(self):
+        page = Page(title='Too deep', slug='x', parent=self.pages[-1],
+                    template='pages.basicpage')
+        with self.assertRaises(ValidationError):
+            page.clean()
+        with self.assertRaises(ValidationError):
+            page.save()
+        self.assertFalse(Page.objects.filter(slug='x').exists())
+
+    def test_descendant_paths(self):
+        page = self.pages[0]
+        page.slug += 'xx'
+        with self.assertRaises(ValidationError):
+            page.clean()
+        with self.assertRaises(ValidationError):
+            page.save()
+        self.assertEqual('0' * 50, self.get_path(page))
+
+        # A shorter slug is fine
+        page.slug = '0' * 50 + 'x'
+        page.save()
+        self.assertEqual(255, len(self.get_path(self.pages[-1])))
+
+    def test_move_to(self):
+        with self.assertRaises(InvalidMove):
+            self.pages[1].move_to(self.other, 'last-child')
+
+        self.assertEqual(self.pages[0].id,
+                         Page.objects.get(id=self.pages[1].id).parent_id)
+        self.assertEqual('0' * 50 + '/' + '1' * 50,
+                         self.get_path(self.pages[1]))
+
+
 class PageContentModelTestCase(TestCase):
 
     def test_model_exists(self):
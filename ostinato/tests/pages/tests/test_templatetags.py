@@ -84,7 +84,7 @@ class FilterPageTemplateTagTestCase(TestCase):
         self.assertTrue(response.is_rendered)
 
 
-class BreadCrumbsTempalteTagTestCase(TestCase):
+class BreadCrumbsTempalteTagTestCase(CommitTestCase):
 
     def test_tag_returns_breadcrumbs_for_page_in_context(self):
         create_pages()
@@ -1,23 +1,38 @@
+import json
+
 from django.test import TestCase, TransactionTestCase
-from django.test.client import RequestFactory
+from django.test.client import Client, RequestFactory
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import caches
 
 from django.core.urlresolvers import reverse
+from django.core.exceptions import ImproperlyConfigured
 from django.contrib.auth.models import User, AnonymousUser
 from django.template.response import TemplateResponse
+from django.utils.http import http_date
 
+from ostinato.pages.cache import make_response_key
 from ostinato.pages.models import Page
 from ostinato.pages.views import (
     PageView,
     page_dispatch,
     PageReorderView,
+    PageMoveView,
     PageDuplicateView,
+    _has_visitor_state,
 )
 from ostinato.pages.forms import DuplicatePageForm
+from ostinato.pages.registry import page_content
+from ostinato.pages import PAGES_SETTINGS
+from ostinato.tests.pages.models import BasicPage, LandingPage
 from .utils import *
 from .factories import *
 
 
-class PageViewTestCase(TestCase):
+class PageViewTestCase(CommitTestCase):
 
     def setUp(self):
         create_pages()
@@ -39,6 +54,15 @@ class PageViewTestCase(TestCase):
         self.assertEqual('pages/landing_page.html',
                          response.templates[0].name)
 
+    def test_dispatch_queries(self):
+        self.client.get('/page-1/page-3/')
+
+        # Only the content is loaded from the database, the page comes from
+        # the page index.
+        with self.assertNumQueries(1):
+            response = self.client.get('/page-1/page-3/')
+        self.assertEqual('page-3', response.context['page'].slug)
+
     def test_view_context(self):
         response = self.client.get('/page-1/')
         self.assertIn('page', response.context)
@@ -51,6 +75,15 @@ class PageViewTestCase(TestCase):
         response = self.client.get('/func-page/')
         self.assertEqual(200, response.status_code)
 
+    def test_nested_page_response(self):
+        response = self.client.get('/page-1/page-3/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('page-3', response.context['page'].slug)
+
+    def test_invalid_ancestry_returns_404(self):
+        response = self.client.get('/page-2/page-3/')
+        self.assertEqual(404, response.status_code)
+
     def test_unauthorized_user_raises_forbidden(self):
         # First we make the page private
         p = Page.objects.get(slug='page-1')
@@ -110,6 +143,207 @@ class SitesEnabledPageViewTestCase(TestCase):
             self.assertEqual('page-2', response.context['page'].slug)
 
 
+class ConditionalResponseTestCase(CommitTestCase):
+
+    def setUp(self):
+        patch_pages_settings(self, CONDITIONAL_RESPONSES=True)
+        create_pages()
+
+    def test_validators(self):
+        response = self.client.get('/page-1/')
+        self.assertTrue(response.has_header('ETag'))
+
+        # Saving another page doesn't change this page's modified_date,
+        # so Last-Modified can't tell if the navbar changed.
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_etag_not_modified(self):
+        etag = self.client.get('/page-1/')['ETag']
+        response = self.client.get('/page-1/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(304, response.status_code)
+        self.assertEqual([], response.templates)
+
+    def test_if_modified_since_ignored(self):
+        response = self.client.get(
+            '/page-1/', HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(200, response.status_code)
+
+    def test_content_opt_out(self):
+        response = self.client.get('/func-page/')
+        self.assertFalse(response.has_header('ETag'))
+
+        response = self.client.get(
+            '/func-page/', HTTP_IF_NONE_MATCH='*',
+            HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('ok', response.content)
+
+    def test_opt_in(self):
+        PAGES_SETTINGS['CONDITIONAL_RESPONSES'] = False
+        response = self.client.get('/page-1/')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(200, self.client.get(
+            '/page-1/', HTTP_IF_NONE_MATCH='*').status_code)
+
+        # Content types can opt in on their own
+        LandingPage.ContentOptions.conditional_response = True
+        try:
+            self.assertEqual(304, self.client.get(
+                '/page-1/', HTTP_IF_NONE_MATCH='*').status_code)
+        finally:
+            del LandingPage.ContentOptions.conditional_response
+
+    def test_content_opt_out_of_conditional_responses(self):
+        LandingPage.ContentOptions.conditional_response = False
+        try:
+            response = self.client.get('/page-1/', HTTP_IF_NONE_MATCH='*')
+        finally:
+            del LandingPage.ContentOptions.conditional_response
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_visitor_state(self):
+        etag = self.client.get('/page-1/')['ETag']
+
+        # The page could show a pending message for the visitor, so it's
+        # always rendered, and has no etag.
+        self.client.cookies['messages'] = 'pending-message'
+        response = self.client.get('/page-1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_etag_changes_after_save(self):
+        etag = self.client.get('/page-1/')['ETag']
+        Page.objects.get(slug='page-2').save()
+
+        response = self.client.get('/page-1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_etag_changes_after_rename(self):
+        etag = self.client.get('/page-1/')['ETag']
+
+        p = Page.objects.get(slug='page-2')
+        p.title = 'Page Two'
+        p.save()
+
+        response = self.client.get('/page-1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+
+class ResponseCacheTestCase(CommitTestCase):
+
+    def setUp(self):
+        patch_pages_settings(self, CACHE_RESPONSES=True)
+        create_pages()
+
+    def test_response_cached(self):
+        self.client.get('/page-1/')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/page-1/')
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn('Page 1 Content', response.content)
+
+    def test_query_string_not_cached(self):
+        # Responses for a query string aren't cached...
+        self.client.get('/page-1/', {'q': 'a'})
+        self.assertIsNotNone(self.client.get('/page-1/').context)
+
+        # ...or served from the cache
+        response = self.client.get('/page-1/', {'q': 'b'})
+        self.assertEqual(200, response.status_code)
+        self.assertIsNotNone(response.context)
+
+        with self.assertNumQueries(0):
+            self.client.get('/page-1/')
+
+    def test_response_key(self):
+        rf = RequestFactory()
+        self.assertEqual(make_response_key(rf.get('/page-1/')),
+                         make_response_key(rf.get('/page-1/', {'q': 'a'})))
+        self.assertNotEqual(make_response_key(rf.get('/page-1/')),
+                            make_response_key(rf.get('/page-2/')))
+
+    def test_cached_response_not_modified(self):
+        PAGES_SETTINGS['CONDITIONAL_RESPONSES'] = True
+        etag = self.client.get('/page-1/')['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/page-1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+    def test_response_cleared_after_page_save(self):
+        self.client.get('/page-1/')
+
+        p = Page.objects.get(slug='page-1')
+        p.title = 'Page One'
+        p.save()
+
+        self.assertEqual(
+            'Page One', self.client.get('/page-1/').context['page'].title)
+
+    def test_response_cleared_after_content_save(self):
+        self.client.get('/page-1/')
+
+        content = Page.objects.get(slug='page-1').contents
+        content.content = 'Changed Content'
+        content.save()
+
+        self.assertIn('Changed Content', self.client.get('/page-1/').content)
+
+    def test_content_opt_out(self):
+        self.client.get('/func-page/')
+        self.assertIsNone(caches['default'].get(
+            make_response_key(RequestFactory().get('/func-page/'))))
+
+    def test_authenticated_response_not_cached(self):
+        User.objects.create_user('tester', 'test@example.com', 'secret')
+        self.client.login(username='tester', password='secret')
+        self.client.get('/page-1/')
+
+        self.assertIsNotNone(self.client.get('/page-1/').context)
+
+    def test_post_not_cached(self):
+        self.client.post('/page-1/')
+
+        response = self.client.get('/page-1/')
+        self.assertEqual(200, response.status_code)
+        self.assertIsNotNone(response.context)
+
+    def test_visitor_state_not_cached(self):
+        for cookie in ['messages', settings.SESSION_COOKIE_NAME]:
+            client = Client()
+            client.cookies[cookie] = 'visitor-state'
+            self.assertIsNotNone(client.get('/page-1/').context)
+
+            # Another visitor doesn't get the response from the cache
+            self.assertIsNotNone(self.client.get('/page-1/').context)
+            caches['default'].clear()
+
+    def test_cached_response_not_served_with_visitor_state(self):
+        self.client.get('/page-1/')
+
+        client = Client()
+        client.cookies['messages'] = 'visitor-state'
+        self.assertIsNotNone(client.get('/page-1/').context)
+
+    def test_added_messages_not_cached(self):
+        request = RequestFactory().get('/page-1/')
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        self.assertFalse(_has_visitor_state(request))
+
+        messages.info(request, 'Saved')
+        self.assertTrue(_has_visitor_state(request))
+
+        request._messages = FallbackStorage(request)
+        request.session['key'] = 'value'
+        self.assertTrue(_has_visitor_state(request))
+
+
 class ViewDispatcherTestCase(TestCase):
 
     urls = 'ostinato.pages.urls'
@@ -138,6 +372,38 @@ class ViewDispatcherTestCase(TestCase):
         self.assertIn('custom', response.context)
         self.assertEqual('Some Custom Context', response.context['custom'])
 
+    def test_function_view_response(self):
+        response = self.client.get('/func-page/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('ok', response.content)
+
+    def test_view_resolved_once(self):
+        view = page_content.get_view(BasicPage)
+        self.client.get('/page-2/')
+        self.assertIs(view, page_content.get_view(BasicPage))
+
+    def test_page_set_before_dispatch(self):
+        class EarlyPage(object):
+            class ContentOptions:
+                view = 'ostinato.tests.pages.views.PageFirstView'
+
+        page = Page.objects.get(slug='page-2')
+        request = RequestFactory().get('/page-2/')
+        request.user = AnonymousUser()
+
+        view = page_content.load_view(EarlyPage)
+        response = view(request, page, path='page-2')
+        self.assertEqual(page, response.context_data['dispatched_page'])
+        self.assertEqual({'path': 'page-2'}, response.context_data['view'].kwargs)
+
+    def test_invalid_view_path(self):
+        class InvalidPage(object):
+            class ContentOptions:
+                view = 'ostinato.tests.pages.views.MissingView'
+
+        with self.assertRaises(ImproperlyConfigured):
+            page_content.load_view(InvalidPage)
+
 
 class PageReorderViewTestCase(TransactionTestCase):
 
@@ -200,6 +466,75 @@ class PageReorderViewTestCase(TransactionTestCase):
         self.assertGreater(p.tree_id, p2.tree_id)
 
 
+class PageMoveViewTestCase(TransactionTestCase):
+
+    def setUp(self):
+        create_pages()
+        User.objects.create_user(
+            'tester', 'test@example.com', 'secret', is_staff=True)
+        self.client.login(username='tester', password='secret')
+
+    def post(self, data):
+        return self.client.post(
+            reverse('ostinato_page_move'), json.dumps(data),
+            content_type='application/json')
+
+    def test_reverse_lookup(self):
+        self.assertEqual('/page_move/', reverse('ostinato_page_move'))
+
+    def test_staff_only(self):
+        self.client.logout()
+        response = self.post({'moves': []})
+        self.assertEqual(302, response.status_code)
+
+    def test_move(self):
+        p1 = Page.objects.get(slug='page-1')
+        p2 = Page.objects.get(slug='page-2')
+        p3 = Page.objects.get(slug='page-3')
+
+        response = self.post({'moves': [
+            {'node': p3.id, 'target': p2.id, 'position': 'first-child'},
+            {'node': p2.id, 'target': p1.id, 'position': 'left'},
+        ]})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'moved': 2}, json.loads(response.content))
+
+        self.assertEqual('page-2/page-3', Page.objects.get(id=p3.id).path)
+        self.assertLess(Page.objects.get(id=p2.id).tree_id,
+                        Page.objects.get(id=p1.id).tree_id)
+
+    def test_invalid_moves(self):
+        p1 = Page.objects.get(slug='page-1')
+        p3 = Page.objects.get(slug='page-3')
+
+        self.assertEqual(400, self.client.post(
+            reverse('ostinato_page_move'), 'not json',
+            content_type='application/json').status_code)
+        self.assertEqual(400, self.post({'moves': [
+            {'node': p3.id, 'target': p1.id, 'position': 'above'}]}
+        ).status_code)
+        self.assertEqual(400, self.post({'moves': [
+            {'node': p3.id, 'target': 999, 'position': 'left'}]}
+        ).status_code)
+
+        # Moving a page to it's own descendant fails, and rolls back the
+        # other moves.
+        response = self.post({'moves': [
+            {'node': p3.id, 'target': p1.id, 'position': 'left'},
+            {'node': p3.id, 'target': p3.id, 'position': 'last-child'},
+        ]})
+        self.assertEqual(400, response.status_code)
+        self.assertEqual('page-1/page-3', Page.objects.get(id=p3.id).path)
+
+    def test_malformed_moves(self):
+        for data in [{'moves': [1]}, {'moves': 'abc'}, {'moves': {}},
+                     {'moves': None}, {}, [], 'abc']:
+            response = self.post(data)
+            self.assertEqual(400, response.status_code)
+            self.assertEqual({'error': 'Expected a list of moves'},
+                             json.loads(response.content))
+
+
 class PageDuplicateViewTestCase(TransactionTestCase):
 
     def setUp(self):
@@ -285,3 +620,16 @@ class PageDuplicateViewTestCase(TransactionTestCase):
         self.assertEqual(
             'Some content for the page', p3.contents.content)
 
+
+    def test_duplicate_page_path(self):
+        p3 = Page.objects.get(slug='page-3')
+        form = DuplicatePageForm({
+            'node': p3.id,
+            'position': 'first-child',
+            'target': Page.objects.get(slug='page-2').id,
+        })
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        self.assertEqual(
+            'page-2/page-3-copy', Page.objects.get(slug='page-3-copy').path)
@@ -1,6 +1,41 @@
+from django.db import transaction
+from django.test import TestCase
+
+from ostinato.pages import PAGES_SETTINGS
+
 from .factories import *
 
 
+class CommitTestCase(TestCase):
+    """
+    The test transaction is never committed, so this runs the
+    ``transaction.on_commit()`` callbacks, like clearing the pages cache,
+    straight away. Use a ``TransactionTestCase`` to test that something only
+    happens after the commit.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(CommitTestCase, cls).setUpClass()
+        cls._on_commit = staticmethod(transaction.on_commit)
+        transaction.on_commit = lambda func, using=None: func()
+
+    @classmethod
+    def tearDownClass(cls):
+        transaction.on_commit = cls._on_commit
+        super(CommitTestCase, cls).tearDownClass()
+
+
+def patch_pages_settings(testcase, **values):
+    """
+    Changes ``PAGES_SETTINGS`` for the rest of the test. These are read
+    once, so ``override_settings`` doesn't work for them.
+    """
+    old_settings = PAGES_SETTINGS.copy()
+    testcase.addCleanup(PAGES_SETTINGS.update, old_settings)
+    PAGES_SETTINGS.update(values)
+
+
 # Now some helper functions to create preset content
 def create_pages():
     p = PageFactory.create(
@@ -12,6 +12,19 @@ class CustomView(PageView):
         return c
 
 
+class PageFirstView(PageView):
+    """ Uses the page before ``PageView.dispatch()`` is called """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.dispatched_page = self.page
+        return super(PageFirstView, self).dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        c = super(PageFirstView, self).get_context_data(**kwargs)
+        c['dispatched_page'] = self.dispatched_page
+        return c
+
+
 def functionview(request, *args, **kwargs):
     return http.HttpResponse('ok')
 
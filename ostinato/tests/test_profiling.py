@@ -0,0 +1,328 @@
+import json
+import marshal
+import os
+import pstats
+import tempfile
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.urlresolvers import resolve, reverse
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+
+from ostinato.middleware import ProfileMiddleware, SamplingProfileMiddleware
+from ostinato.profiling import (
+    Sampler, RequestSamples, PROFILE_SETTINGS, fold_stacks, sampler)
+from ostinato.tests.pages.tests.utils import create_pages
+
+
+def view_a(request):
+    return HttpResponse('a')
+
+
+def view_b(request):
+    return HttpResponse('b')
+
+
+@override_settings(DEBUG=True)
+class ProfileMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        self.middleware = ProfileMiddleware()
+        self.rf = RequestFactory()
+
+    def get_request(self, query='prof'):
+        request = self.rf.get('/?%s' % query)
+        request.user = AnonymousUser()
+        return request
+
+    def profile(self, view, query='prof'):
+        request = self.get_request(query)
+        self.middleware.process_request(request)
+        response = self.middleware.process_view(request, view, (), {})
+        return self.middleware.process_response(request, response)
+
+    def get_names(self, stats):
+        return set(name for (filename, lineno, name) in stats)
+
+    def test_not_enabled(self):
+        request = self.get_request('')
+        self.middleware.process_request(request)
+        self.assertFalse(hasattr(request, '_profiler'))
+        self.assertIsNone(self.middleware.process_view(request, view_a, (), {}))
+
+    @override_settings(DEBUG=False)
+    def test_superuser_only(self):
+        request = self.get_request()
+        self.middleware.process_request(request)
+        self.assertFalse(hasattr(request, '_profiler'))
+
+    def test_html(self):
+        response = self.profile(view_a)
+        self.assertIn('view_a', response.content)
+        self.assertIn('---- By file ----', response.content)
+        self.assertIn('---- By group ---', response.content)
+
+    def test_pstats(self):
+        response = self.profile(view_a, 'prof=pstats')
+        self.assertIn('profile.pstats', response['Content-Disposition'])
+        self.assertIn('view_a', self.get_names(marshal.loads(response.content)))
+
+        # The file can be loaded with pstats
+        fd, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(response.content)
+            stats = pstats.Stats(filename)
+        finally:
+            os.remove(filename)
+        self.assertIn('view_a', self.get_names(stats.stats))
+
+    def test_callgrind(self):
+        response = self.profile(view_a, 'prof=callgrind')
+        self.assertIn('profile.callgrind', response['Content-Disposition'])
+
+        lines = response.content.splitlines()
+        self.assertEqual('events: Microseconds', lines[0])
+        self.assertIn('fn=view_a', lines)
+
+        # view_a calls HttpResponse, which shows up as a call from view_a.
+        # The functions are in no particular order, so view_a's block runs
+        # up to the next function, or the end.
+        index = lines.index('fn=view_a')
+        end = next((i for i, line in enumerate(lines)
+                    if i > index and line.startswith('fn=')), len(lines))
+        self.assertIn('cfn=__init__', lines[index:end])
+
+    def test_profiler_per_request(self):
+        # Interleave two requests, like a threaded server would
+        request_a, request_b = self.get_request('prof=pstats'), \
+            self.get_request('prof=pstats')
+        self.middleware.process_request(request_a)
+        self.middleware.process_request(request_b)
+        self.assertIsNot(request_a._profiler, request_b._profiler)
+
+        response_b = self.middleware.process_view(request_b, view_b, (), {})
+        response_a = self.middleware.process_view(request_a, view_a, (), {})
+
+        names_a = self.get_names(marshal.loads(
+            self.middleware.process_response(request_a, response_a).content))
+        names_b = self.get_names(marshal.loads(
+            self.middleware.process_response(request_b, response_b).content))
+
+        self.assertIn('view_a', names_a)
+        self.assertNotIn('view_b', names_a)
+        self.assertIn('view_b', names_b)
+        self.assertNotIn('view_a', names_b)
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class SamplerTestCase(TestCase):
+
+    def setUp(self):
+        self.sampler = Sampler(interval=0.001)
+
+    def test_samples(self):
+        samples = self.sampler.start()
+        self.sampler.sample()
+        self.sampler.stop(samples)
+
+        # The sampling thread may have added more samples of it's own
+        self.assertGreaterEqual(sum(samples.stacks.values()), 1)
+        for stack in samples.stacks:
+            self.assertTrue(any('(test_samples)' in f for f in stack))
+
+    def test_thread_stops_when_idle(self):
+        samples = self.sampler.start()
+        thread = self.sampler._thread
+        busy(0.05)
+        self.sampler.stop(samples)
+
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.sampler._thread)
+        self.assertGreater(sum(samples.stacks.values()), 1)
+
+    def test_record(self):
+        samples = RequestSamples(1)
+        samples.label = 'test_view'
+        samples.stacks[('a', 'b')] = 1
+        samples.stacks[('a', 'c')] = 1
+        self.sampler.record(samples)
+        self.sampler.record(samples)
+
+        summary = self.sampler.get_summary()
+        self.assertEqual({'test_view': {'requests': 2, 'samples': 4}}, summary)
+
+        self.assertEqual(['test_view;a;b 2', 'test_view;a;c 2'],
+                         sorted(self.sampler.get_folded()))
+
+        self.sampler.reset()
+        self.assertEqual({}, self.sampler.get_summary())
+
+    def test_max_stacks(self):
+        sampler = Sampler(max_stacks=2)
+        samples = RequestSamples(1)
+        samples.label = 'test_view'
+        samples.stacks[('a', 'b')] = 1
+        samples.stacks[('a', 'c')] = 1
+        sampler.record(samples)
+
+        samples = RequestSamples(1)
+        samples.label = 'test_view'
+        samples.stacks[('a', 'b')] = 1
+        samples.stacks[('a', 'd')] = 2
+        samples.stacks[('a', 'e')] = 3
+        sampler.record(samples)
+
+        self.assertEqual({'test_view': {'requests': 2, 'samples': 8}},
+                         sampler.get_summary())
+        self.assertEqual(
+            ['test_view;[other] 5', 'test_view;a;b 2', 'test_view;a;c 1'],
+            sorted(sampler.get_folded()))
+
+    def test_output_file(self):
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        PROFILE_SETTINGS['OUTPUT_FILE'] = filename
+        try:
+            samples = RequestSamples(1)
+            samples.label = 'test_view'
+            samples.stacks[('a', 'b')] = 3
+            self.sampler.record(samples)
+
+            with open(filename) as f:
+                self.assertEqual('test_view;a;b 3\n', f.read())
+        finally:
+            PROFILE_SETTINGS['OUTPUT_FILE'] = None
+            os.remove(filename)
+
+    def test_fold_stacks(self):
+        self.assertEqual(
+            ['view;a;b 2'], fold_stacks('view', {('a', 'b'): 2}))
+
+
+class SamplingProfileMiddlewareTestCase(TestCase):
+
+    def setUp(self):
+        create_pages()
+        self.old_settings = PROFILE_SETTINGS.copy()
+        PROFILE_SETTINGS['SAMPLE_RATE'] = 1
+        sampler.reset()
+
+    def tearDown(self):
+        PROFILE_SETTINGS.update(self.old_settings)
+        sampler.reset()
+
+    def test_not_used(self):
+        PROFILE_SETTINGS['SAMPLE_RATE'] = 0
+        with self.assertRaises(MiddlewareNotUsed):
+            SamplingProfileMiddleware()
+
+    def get_label(self, path):
+        match = resolve(path)
+        return SamplingProfileMiddleware().get_label(
+            RequestFactory().get(path), match.func, match.kwargs)
+
+    def test_labels(self):
+        self.assertEqual(
+            'page_dispatch:pages.landingpage', self.get_label('/'))
+        self.assertEqual(
+            'page_dispatch:pages.basicpage', self.get_label('/page-2/'))
+        self.assertEqual(
+            'page_dispatch:not_found', self.get_label('/missing/'))
+        self.assertEqual(
+            'ostinato.views.ProfileSamplesView',
+            self.get_label('/ostinato/profile_samples/'))
+
+    @override_settings(OSTINATO_PAGES_SITE_TREEID=2)
+    def test_labels_for_site(self):
+        self.assertEqual(
+            'page_dispatch:pages.basicpage', self.get_label('/'))
+        self.assertEqual(
+            'page_dispatch:not_found', self.get_label('/page-1/'))
+
+    def test_request_recorded(self):
+        middleware = SamplingProfileMiddleware()
+        request = RequestFactory().get('/')
+        match = resolve('/')
+
+        middleware.process_request(request)
+        middleware.process_view(request, match.func, (), match.kwargs)
+        sampler.sample()
+        middleware.process_response(request, HttpResponse())
+
+        # The sampling thread may have added more samples of it's own
+        summary = sampler.get_summary()
+        self.assertEqual(['page_dispatch:pages.landingpage'], list(summary))
+        self.assertEqual(
+            1, summary['page_dispatch:pages.landingpage']['requests'])
+        self.assertGreaterEqual(
+            summary['page_dispatch:pages.landingpage']['samples'], 1)
+
+    def test_label_uses_dispatched_entry(self):
+        match = resolve('/')
+        request = RequestFactory().get('/')
+        request._page_entry = None
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                'page_dispatch:not_found', SamplingProfileMiddleware()
+                .get_label(request, match.func, match.kwargs))
+
+    def test_only_recorded_requests_are_labelled(self):
+        middleware = SamplingProfileMiddleware()
+        request = RequestFactory().get('/')
+        match = resolve('/')
+
+        middleware.process_request(request)
+        request._profile_sampled = False
+        middleware.process_view(request, match.func, (), match.kwargs)
+        middleware.process_response(request, HttpResponse())
+
+        self.assertIsNone(request._profile_samples.label)
+        self.assertEqual({}, sampler.get_summary())
+
+
+class ProfileSamplesViewTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(
+            'tester', 'test@example.com', 'secret', is_staff=True)
+        self.client.login(username='tester', password='secret')
+        self.url = reverse('ostinato_profile_samples')
+
+        samples = RequestSamples(1)
+        samples.label = 'test_view'
+        samples.stacks[('a', 'b')] = 3
+        sampler.record(samples)
+
+    def tearDown(self):
+        sampler.reset()
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(302, self.client.get(self.url).status_code)
+
+    def test_folded(self):
+        response = self.client.get(self.url)
+        self.assertEqual('text/plain', response['Content-Type'])
+        self.assertEqual('test_view;a;b 3', response.content)
+
+    def test_json(self):
+        response = self.client.get(self.url, {'format': 'json'})
+        self.assertEqual(
+            {'test_view': {'requests': 1, 'samples': 3}},
+            json.loads(response.content))
+
+    def test_reset(self):
+        response = self.client.post(self.url)
+        self.assertEqual(204, response.status_code)
+        self.assertEqual({}, sampler.get_summary())
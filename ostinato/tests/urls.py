@@ -4,6 +4,7 @@ from django.contrib import admin
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
+    url(r'^ostinato/', include('ostinato.urls')),
     url(r'^', include('ostinato.pages.urls')),
 ]
 
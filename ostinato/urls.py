@@ -0,0 +1,8 @@
+from django.conf.urls import url
+from ostinato.views import ProfileSamplesView
+
+
+urlpatterns = [
+    url(r'^profile_samples/$', ProfileSamplesView.as_view(),
+        name='ostinato_profile_samples'),
+]
@@ -1,18 +1,136 @@
+import gc
+import json
+import math
 import time
+import timeit
+
+from django.db import connections
+
+try:
+    import tracemalloc
+except ImportError:  # Only available on Python 3.4+
+    tracemalloc = None
+
+
+# The most precise timer available for measuring short durations
+timer = getattr(time, 'perf_counter', timeit.default_timer)
+
 
 class benchmark(object):
     """
     A simple benchmarking class borrowed from:
     http://dabeaz.blogspot.co.uk/2010/02/context-manager-for-timing-benchmarks.html
+
+    The time taken is available as ``elapsed`` afterwards. For anything
+    more than a quick check, use ``run_benchmark()`` instead.
     """
-    def __init__(self,name):
+    def __init__(self, name, verbose=True):
         self.name = name
+        self.verbose = verbose
+        self.elapsed = None
 
     def __enter__(self):
-        self.start = time.time()
+        self.start = timer()
+        return self
 
     def __exit__(self,ty,val,tb):
-        end = time.time()
-        print("%s : %0.3f seconds" % (self.name, end-self.start))
+        self.elapsed = timer() - self.start
+        if self.verbose:
+            print("%s : %0.3f seconds" % (self.name, self.elapsed))
         return False
 
+
+def percentile(values, percent):
+    """ Returns the ``percent`` percentile for ``values``, interpolated """
+    values = sorted(values)
+    k = (len(values) - 1) * percent / 100.0
+    f, c = int(math.floor(k)), int(math.ceil(k))
+
+    if f == c:
+        return values[f]
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+def run_benchmark(func, name=None, repeat=10, number=1, warmup=1,
+                  count_queries=True, track_memory=True, using='default'):
+    """
+    Times ``func``, and returns a dictionary with the results, which can
+    be serialized with ``to_json()``.
+
+    ``func`` is called ``warmup`` times first, to fill caches etc. It's then
+    called ``number`` times in a row, ``repeat`` times over, and the
+    timings (in seconds per call) for the repeats are summarized. The
+    garbage collector is disabled while timing.
+
+    ``func`` is called one more time for each of ``count_queries`` (the
+    amount of queries made on the ``using`` database) and ``track_memory``
+    (the peak memory allocated, in bytes), so that these don't influence
+    the timings. Tracking memory needs tracemalloc, which is only available
+    on Python 3.4+, so ``memory_peak`` is always None on Python 2.
+    """
+    # Only import the test utilities when benchmarks are actually run
+    from django.test.utils import CaptureQueriesContext
+
+    for i in range(warmup):
+        func()
+
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            start = timer()
+            for j in range(number):
+                func()
+            timings.append((timer() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    mean = sum(timings) / len(timings)
+    result = {
+        'name': name or getattr(func, '__name__', None),
+        'repeat': repeat,
+        'number': number,
+        'min': min(timings),
+        'max': max(timings),
+        'mean': mean,
+        'stdev': math.sqrt(
+            sum((t - mean) ** 2 for t in timings) / len(timings)),
+        'median': percentile(timings, 50),
+        'p90': percentile(timings, 90),
+        'p95': percentile(timings, 95),
+        'p99': percentile(timings, 99),
+        'queries': None,
+        'memory_peak': None,
+    }
+
+    if count_queries:
+        with CaptureQueriesContext(connections[using]) as queries:
+            func()
+        result['queries'] = len(queries)
+
+    if track_memory and tracemalloc:
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.clear_traces()
+        start_memory = tracemalloc.get_traced_memory()[0]
+
+        func()
+
+        result['memory_peak'] = \
+            tracemalloc.get_traced_memory()[1] - start_memory
+        if not tracing:
+            tracemalloc.stop()
+
+    return result
+
+
+def to_json(results, **extra):
+    """ Serializes a list of ``run_benchmark()`` results """
+    data = dict(extra, results=results)
+    return json.dumps(data, indent=2, sort_keys=True)
@@ -1,6 +1,11 @@
 import json
 from django import http
 from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.decorators import method_decorator
+from django.views.generic import View
+
+from ostinato.profiling import sampler
 
 
 class AjaxTemplateResponseMixin(object):
@@ -21,3 +26,26 @@ class JsonResponseMixin(object):
         data = json.dumps(data, cls=DjangoJSONEncoder)
         return http.HttpResponse(
             data, content_type='application/json; charset=utf-8')
+
+
+class ProfileSamplesView(JsonResponseMixin, View):
+    """
+    Shows the results from the ``SamplingProfileMiddleware``. This returns
+    the folded stacks by default, or the amount of requests and samples for
+    every view with ``?format=json``. POST to clear the results.
+    """
+
+    @method_decorator(staff_member_required)
+    def dispatch(self, *args, **kwargs):
+        return super(ProfileSamplesView, self).dispatch(*args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            return self.render_json_response(sampler.get_summary())
+
+        return http.HttpResponse(
+            '\n'.join(sampler.get_folded()), content_type='text/plain')
+
+    def post(self, request, *args, **kwargs):
+        sampler.reset()
+        return http.HttpResponse(status=204)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Runs the ostinato benchmarks against an in-memory SQLite database, and
+writes the results as JSON.
+
+    python runbenchmarks.py --sizes 1000,10000 --output results.json
+
+The benchmarks that don't depend on the size of the tree (the statemachine,
+content filters and registry lookups) only run once.
+
+Pass ``--compare`` with the results from an earlier run to report any
+benchmarks that got slower.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+
+import django
+from django.conf import settings
+
+
+def run_size(size, args):
+    """
+    Runs the benchmarks for a tree with ``size`` pages, or the benchmarks
+    that don't need a tree when ``size`` is None.
+    """
+    from django.core.cache import caches
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.test.runner import DiscoverRunner
+
+    from ostinato.tests.benchmarks import BENCHMARKS, load_benchmarks
+    from ostinato.tests.benchmarks.trees import create_tree, get_sample_pages
+    from ostinato.utils import run_benchmark
+
+    load_benchmarks()
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    caches['default'].clear()
+
+    results = []
+    try:
+        if size:
+            tree = create_tree(size, depth=args.depth, fan_out=args.fan_out)
+            samples = get_sample_pages(tree)
+
+        for bench in BENCHMARKS:
+            if args.only and bench.name not in args.only:
+                continue
+            if bench.tree != bool(size):
+                continue
+
+            result = run_benchmark(
+                bench.func(samples) if size else bench.func(),
+                name=bench.name,
+                repeat=args.repeat or bench.repeat,
+                number=bench.number,
+                warmup=args.warmup)
+            result['size'] = size
+            results.append(result)
+
+            sys.stderr.write('%8s %-28s %12.4fms %12.4fms %6s queries\n' % (
+                size or '-', bench.name, result['median'] * 1000,
+                result['p95'] * 1000, result['queries']))
+
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ Returns the results that are slower than ``threshold`` * baseline """
+    baseline = dict(((r['name'], r['size']), r) for r in baseline['results'])
+
+    slower = []
+    for result in results:
+        base = baseline.get((result['name'], result['size']))
+        if base and result['min'] > base['min'] * threshold:
+            slower.append((result, result['min'] / base['min']))
+
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the ostinato benchmarks')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma separated list of tree sizes')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fan-out', type=int, default=10)
+    parser.add_argument('--repeat', type=int,
+                        help='Override the repeat for every benchmark')
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='Calls to make before timing every benchmark')
+    parser.add_argument('--only', nargs='*',
+                        help='Only run the benchmarks with these names')
+    parser.add_argument('--output', help='Write the results to this file')
+    parser.add_argument('--compare', help='Results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Report benchmarks slower than baseline * this')
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'ostinato.tests.test_settings'
+    django.setup()
+
+    from ostinato.utils import to_json
+
+    results = run_size(None, args)
+    for size in args.sizes.split(','):
+        results += run_size(int(size), args)
+
+    output = to_json(
+        results,
+        python=platform.python_version(),
+        django=django.get_version(),
+        database=settings.DATABASES['default']['ENGINE'],
+        depth=args.depth,
+        fan_out=args.fan_out)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.threshold)
+
+        for result, ratio in slower:
+            sys.stderr.write('SLOWER: %s (%s pages) %.2fx\n' % (
+                result['name'], result['size'] or '-', ratio))
+
+        sys.exit(bool(slower))